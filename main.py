@@ -167,12 +167,14 @@ class SchemeGUI:
         finally:
             self.write_to_log(f"-------------------------\n")
 
-    def execute_many_commands(self, commands: list):
-        cmd = commands[0]
+    def execute_many_commands(self, commands: list, start: int = 0):
+        """Execute commands[start], then schedule the next one. The index is passed
+        instead of a slice of the rest, so loading k commands doesn't copy O(k**2) items"""
+        cmd = commands[start]
         self.execute_scheme_command(cmd)
 
-        if len(commands) > 1:
-            self._master.after(10, lambda: self.execute_many_commands(commands[1:]))
+        if start + 1 < len(commands):
+            self._master.after(10, lambda: self.execute_many_commands(commands, start + 1))
         else:
             self.write_to_log(f"-------------------------\n"
                               f"Scheme added\n")
@@ -188,7 +190,7 @@ class SchemeGUI:
 
         try:
             with open(path, 'r', encoding='utf-8-sig') as f:
-                lines = f.readlines()
+                commands = [command for command in map(str.strip, f) if command]
         except Exception as ex:
             self.write_to_log(f"Status: Error\n"
                               f"Error message: {ex}\n")
@@ -198,9 +200,8 @@ class SchemeGUI:
         finally:
             self.write_to_log(f"-------------------------\n")
 
-        commands = [line.strip() for line in lines if line.strip()]
-
-        self.execute_many_commands(commands)
+        if commands:
+            self.execute_many_commands(commands)
 
     def close_app(self):
         showinfo(':)', 'Thanks for using L4Logic today')
@@ -0,0 +1,285 @@
+"""
+compiled_scheme.py
+
+Lowers a combinational scheme to flat arrays (structure of arrays) and evaluates all of it
+with a single loop over these arrays. The loop is compiled to native code with numba if
+it is installed. Otherwise the arrays are turned into the source of a straight-line Python
+function, which is compiled once and evaluates all the nodes without any dispatch.
+Wide schemes are evaluated by layers instead: the nodes of one operation in one layer are
+evaluated by a single numpy operation.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+from src.elements import ALL_LANES, NO_LANES
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    # numba is optional
+    NUMBA_AVAILABLE = False
+
+    def njit(*_args, **_kwargs):
+        def decorator(function):
+            return function
+        return decorator
+
+
+# operation codes of the nodes
+OP_SOURCE = 0  # the wire is filled before evaluation (constants and variables)
+OP_AND = 1
+OP_OR = 2
+OP_XOR = 3
+OP_NAND = 4
+OP_NOR = 5
+OP_NOT = 6
+OP_MUX2 = 7  # operands: low, high, select
+
+_GATE_OPS = {'AND': OP_AND, 'OR': OP_OR, 'XOR': OP_XOR, 'NAND': OP_NAND, 'NOR': OP_NOR,
+             'NOT': OP_NOT}
+
+_OP_SYMBOLS = {OP_AND: '&', OP_OR: '|', OP_XOR: '^', OP_NAND: '&', OP_NOR: '|'}
+_OP_UFUNCS = {OP_AND: np.bitwise_and, OP_OR: np.bitwise_or, OP_XOR: np.bitwise_xor,
+              OP_NAND: np.bitwise_and, OP_NOR: np.bitwise_or}
+# operands per line of the generated source, long expressions overflow the parser
+_MAX_OPERANDS_PER_LINE = 32
+# nodes per group of the layered evaluation starting from which it is used instead of the
+# generated function, one numpy call per group costs about as much as a few lines of it
+_MIN_NODES_PER_GROUP = 8
+
+
+@njit(cache=True)
+def _eval_circuit(op_codes, offsets, operands, wires):
+    """Evaluate the nodes in order. The operands of node i are
+    wires[operands[offsets[i]:offsets[i+1]]], its output is wires[i].
+    """
+    for node in range(op_codes.shape[0]):
+        op = op_codes[node]
+        if op == OP_SOURCE:
+            continue
+        start = offsets[node]
+        end = offsets[node + 1]
+        acc = wires[operands[start]].copy()
+        if op == OP_MUX2:
+            select = wires[operands[start + 2]]
+            acc = (acc & ~select) | (wires[operands[start + 1]] & select)
+        elif op == OP_NOT:
+            acc = ~acc
+        else:
+            for j in range(start + 1, end):
+                if op == OP_AND or op == OP_NAND:
+                    acc &= wires[operands[j]]
+                elif op == OP_OR or op == OP_NOR:
+                    acc |= wires[operands[j]]
+                else:
+                    acc ^= wires[operands[j]]
+            if op == OP_NAND or op == OP_NOR:
+                acc = ~acc
+        wires[node, :] = acc
+
+
+class CompiledScheme:
+    """A combinational scheme lowered to arrays of operation codes and operands.
+    Every node of the lowered scheme has one wire, which is a row of np.uint64 words
+    (see BasicElement.calc_vector). Multiplexers are lowered to trees of 2:1 multiplexers.
+    Methods
+    -------
+    evaluate(variable_words, num_words)
+        Evaluate the scheme in parallel trials
+    evaluate_signals()
+        Evaluate the scheme once for the current values of the sources
+    fused_function
+        The whole scheme as one generated Python function
+    groups
+        The nodes grouped by layer, operation and number of operands
+    """
+
+    def __init__(self, ordered_elements):
+        """Lower the elements, which must be in topological order (see
+        scheme._evaluation_order). Raise NotImplementedError if some element can't be lowered.
+        """
+        self._op_codes = []
+        self._offsets = [0]
+        self._operands = []
+        self._wire_of_element = {}
+        self._sources = []
+        self._fused_function = None
+        self._groups = None
+
+        for element in ordered_elements:
+            element_type = element.element_type
+            if element_type in ('CONSTANT', 'VARIABLE'):
+                wire = self._add_node(OP_SOURCE, [])
+                self._sources.append((wire, element))
+            elif element_type in _GATE_OPS:
+                wire = self._add_node(_GATE_OPS[element_type],
+                                      [self._read_wire(element, label) for label in element.ins])
+            elif element_type == 'MULTIPLEXER':
+                wire = self._lower_multiplexer(element)
+            else:
+                raise NotImplementedError(f"Element type <{element_type}> can't be compiled")
+            self._wire_of_element[element.id] = wire
+
+        self._op_codes = np.array(self._op_codes, dtype=np.int8)
+        self._offsets = np.array(self._offsets, dtype=np.int32)
+        self._operands = np.array(self._operands, dtype=np.int32)
+
+    def _add_node(self, op_code, operand_wires) -> int:
+        self._op_codes.append(op_code)
+        self._operands.extend(operand_wires)
+        self._offsets.append(len(self._operands))
+        return len(self._op_codes) - 1
+
+    def _read_wire(self, element, input_label) -> int:
+        connection = element.ins[input_label]
+        if connection is None:
+            raise ValueError(f"Input <{input_label}> of element <{element.id}> is not connected")
+        return self._wire_of_element[connection.source.id]
+
+    def _lower_multiplexer(self, element) -> int:
+        # inputs of a multiplexer are sel1, ..., sel{n}, in1, ..., in{2**n}
+        input_labels = list(element.ins)
+        num_select_lines = element.number_select_lines
+        candidates = [self._read_wire(element, label) for label in input_labels[num_select_lines:]]
+        for label in input_labels[:num_select_lines]:
+            select = self._read_wire(element, label)
+            candidates = [self._add_node(OP_MUX2, [low, high, select])
+                          for low, high in zip(candidates[::2], candidates[1::2])]
+        return candidates[0]
+
+    def _generate_source(self) -> str:
+        """Generate the source of function evaluate(sources, mask) that takes the words of
+        the sources in the order of self._sources and returns the words of all the wires.
+        Inversion is a xor with <mask>, so the function works for np.uint64 words
+        and for Python ints of any width.
+        """
+        lines = ['def evaluate(sources, mask):']
+        if self._sources:
+            lines.append('    ' + ''.join(f'w{wire}, ' for wire, _ in self._sources) + '= sources')
+        for node, op_code in enumerate(self._op_codes):
+            if op_code == OP_SOURCE:
+                continue
+            operands = [f'w{wire}' for wire in self._operands[self._offsets[node]:self._offsets[node + 1]]]
+            if op_code == OP_MUX2:
+                low, high, select = operands
+                lines.append(f'    w{node} = ({low} & (mask ^ {select})) | ({high} & {select})')
+            elif op_code == OP_NOT:
+                lines.append(f'    w{node} = mask ^ {operands[0]}')
+            else:
+                symbol = f' {_OP_SYMBOLS[op_code]} '
+                for start in range(0, len(operands), _MAX_OPERANDS_PER_LINE):
+                    chunk = symbol.join(operands[start:start + _MAX_OPERANDS_PER_LINE])
+                    if start == 0:
+                        lines.append(f'    w{node} = {chunk}')
+                    else:
+                        lines.append(f'    w{node} = w{node}{symbol}({chunk})')
+                if op_code in (OP_NAND, OP_NOR):
+                    lines.append(f'    w{node} = mask ^ w{node}')
+        lines.append('    return (' + ''.join(f'w{wire}, ' for wire in range(len(self._op_codes))) + ')')
+        return '\n'.join(lines) + '\n'
+
+    @property
+    def fused_function(self):
+        """The function generated by _generate_source, compiled on first access"""
+        if self._fused_function is None:
+            namespace = {}
+            exec(compile(self._generate_source(), '<compiled scheme>', 'exec'), namespace)
+            self._fused_function = namespace['evaluate']
+        return self._fused_function
+
+    @property
+    def groups(self) -> list:
+        """Nodes grouped for the layered evaluation, built on first access. Every group is
+        (op_code, nodes, operands), where <operands> has a row of operand wires per node.
+        The operands of a group are in the previous groups, and the groups of one layer
+        don't depend on each other
+        """
+        if self._groups is None:
+            layer_of = np.zeros(len(self._op_codes), dtype=np.int32)
+            members = {}
+            for node, op_code in enumerate(self._op_codes):
+                if op_code == OP_SOURCE:
+                    continue
+                operands = self._operands[self._offsets[node]:self._offsets[node + 1]]
+                layer_of[node] = layer_of[operands].max() + 1
+                members.setdefault((layer_of[node], op_code, len(operands)), []).append(node)
+            self._groups = [(op_code, np.array(nodes, dtype=np.int32),
+                             np.array([self._operands[self._offsets[node]:self._offsets[node + 1]]
+                                       for node in nodes], dtype=np.int32))
+                            for (_, op_code, _), nodes in sorted(members.items())]
+        return self._groups
+
+    def _source_words(self, variable_words: Dict, num_words: int) -> list:
+        source_words = []
+        for _, element in self._sources:
+            if element.id in variable_words:
+                source_words.append(variable_words[element.id])
+            else:
+                constant = ALL_LANES if element.calc_value(update=False)['out'] else NO_LANES
+                source_words.append(np.full(num_words, constant, dtype=np.uint64))
+        return source_words
+
+    def _evaluate_kernel(self, source_words: list, num_words: int):
+        wires = np.zeros((len(self._op_codes), num_words), dtype=np.uint64)
+        for (wire, _), words in zip(self._sources, source_words):
+            wires[wire] = words
+        _eval_circuit(self._op_codes, self._offsets, self._operands, wires)
+        return wires
+
+    def _evaluate_fused(self, source_words: list, num_words: int):
+        return self.fused_function(source_words, ALL_LANES)
+
+    def _evaluate_layered(self, source_words: list, num_words: int):
+        wires = np.zeros((len(self._op_codes), num_words), dtype=np.uint64)
+        for (wire, _), words in zip(self._sources, source_words):
+            wires[wire] = words
+        for op_code, nodes, operands in self.groups:
+            # words of the operands, one row of operands for every node of the group
+            operand_words = wires[operands]
+            if op_code == OP_MUX2:
+                select = operand_words[:, 2]
+                words = (operand_words[:, 0] & ~select) | (operand_words[:, 1] & select)
+            elif op_code == OP_NOT:
+                words = ~operand_words[:, 0]
+            else:
+                words = _OP_UFUNCS[op_code].reduce(operand_words, axis=1)
+                if op_code in (OP_NAND, OP_NOR):
+                    words = ~words
+            wires[nodes] = words
+        return wires
+
+    def evaluate(self, variable_words: Dict, num_words: int) -> Dict[str, Dict[str, np.ndarray]]:
+        """Evaluate the scheme. <variable_words> maps ids of variables to their words, other
+        variables and constants have the same value in all the trials.
+        Return: dictionary that maps ids of elements to dictionaries of their words
+        """
+        source_words = self._source_words(variable_words, num_words)
+        if NUMBA_AVAILABLE:
+            wires = self._evaluate_kernel(source_words, num_words)
+        elif len(self._op_codes) - len(self._sources) >= _MIN_NODES_PER_GROUP * len(self.groups):
+            wires = self._evaluate_layered(source_words, num_words)
+        else:
+            wires = self._evaluate_fused(source_words, num_words)
+
+        return {id_: {'out': wires[wire]} for id_, wire in self._wire_of_element.items()}
+
+    def evaluate_signals(self) -> Optional[Dict[str, Dict[str, bool]]]:
+        """Evaluate the scheme once for the current values of the constants and variables,
+        with the kernel if numba is installed and the generated function on booleans otherwise.
+        Return: dictionary that maps ids of elements to their values (see BasicElement.value),
+                or None if some source is unknown, since the lowered operations are two-valued
+        """
+        source_values = [element.calc_value(update=False)['out'] for _, element in self._sources]
+        if None in source_values:
+            return None
+        if NUMBA_AVAILABLE:
+            source_words = [np.full(1, ALL_LANES if value else NO_LANES, dtype=np.uint64)
+                            for value in source_values]
+            wires = (self._evaluate_kernel(source_words, 1)[:, 0] & 1).astype(bool).tolist()
+        else:
+            wires = self.fused_function(source_values, True)
+
+        return {id_: {'out': wires[wire]} for id_, wire in self._wire_of_element.items()}
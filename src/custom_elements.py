@@ -8,21 +8,23 @@ import math
 class Constant(sd_elem.Element):
     """Element that holds one value all time"""
 
+    clen = 0.5
+    cheight = 0.9
+
+    # the segments that don't depend on the value
+    BOX_PATH = ((-clen / 2, -cheight / 2),
+                (-clen / 2, cheight / 2),
+                (clen / 2, cheight / 2),
+                (clen / 2, -cheight / 2),
+                (-clen / 2, -cheight / 2))
+    LEAD_PATH = ((clen / 2, 0), (clen / 2 + 0.2, 0))
+
     def __init__(self, *d, constant_value: bool = True, lbl_size: float = 10,
                  **kwargs):
         super().__init__(*d, **kwargs)
 
-        self.clen = 0.5
-        self.cheight = 0.9
-
-        self.segments.append(Segment([(-self.clen / 2, -self.cheight / 2),
-                                      (-self.clen / 2, self.cheight / 2),
-                                      (self.clen / 2, self.cheight / 2),
-                                      (self.clen / 2, -self.cheight / 2),
-                                      (-self.clen / 2, -self.cheight / 2)]))
-
-        self.segments.append(Segment([(self.clen / 2, 0),
-                                      (self.clen / 2 + 0.2, 0)]))
+        self.segments.append(Segment(list(self.BOX_PATH)))
+        self.segments.append(Segment(list(self.LEAD_PATH)))
         self.segments.append(SegmentText((0, 0),
                                          str(int(constant_value)),
                                          fontsize=lbl_size))
@@ -32,18 +34,20 @@ class Constant(sd_elem.Element):
 
 
 class Variable(Constant):
+    # the contacts of the switch and the switch between them
+    SWITCH_CONTACTS = ((-Constant.clen / 6, Constant.cheight / 3),
+                       (Constant.clen / 6, Constant.cheight / 3))
+    SWITCH_PATH = ((-Constant.clen / 6, Constant.cheight / 3),
+                   (Constant.clen / 6, Constant.cheight / 3 + Constant.cheight / 12))
+
     def __init__(self, *d, constant_value: bool = True, lbl_size: float = 10,
                  **kwargs):
         super().__init__(*d, constant_value=constant_value, lbl_size=lbl_size,
                          **kwargs)
 
-        self.segments.append(
-            SegmentCircle((-self.clen / 6, self.cheight / 3), 0.01, fill=None))
-        self.segments.append(
-            SegmentCircle((self.clen / 6, self.cheight / 3), 0.01, fill=None))
-        self.segments.append(Segment([(-self.clen / 6, self.cheight / 3),
-                                      (self.clen / 6,
-                                       self.cheight / 3 + self.cheight / 12)]))
+        for contact in self.SWITCH_CONTACTS:
+            self.segments.append(SegmentCircle(contact, 0.01, fill=None))
+        self.segments.append(Segment(list(self.SWITCH_PATH)))
 
 
 class Not(sd_elem.Element):
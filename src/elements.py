@@ -22,12 +22,42 @@ You can use the following classes from this module:
 
 import functools
 import random
-from typing import Dict, Optional
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
 from src.truth_tables import TruthTable
 
+# words of 64 parallel trials (lanes) in which the signal is high in all / none of the trials
+ALL_LANES = np.uint64(0xFFFFFFFFFFFFFFFF)
+NO_LANES = np.uint64(0)
+
+# number of the last values that the elements with the same outputs keep for reuse (see _shared_values_of)
+_MAX_SHARED_VALUES = 256
+
+# the possible values of the elements with the single output 'out' (see BasicElement._init_out_values)
+_SINGLE_OUT_VALUES = {state: MappingProxyType({'out': state}) for state in (False, True, None)}
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_values_of(out_labels: Tuple[str, ...]) -> Callable[[Optional[int]], Mapping]:
+    """Return the function that maps a result to the value in which output i (in the order of
+    <out_labels>) is bit i of the result, or all the outputs are unknown if the result is None.
+    The values are cached read-only mappings shared by all the elements with these outputs,
+    so the elements don't hold the cache and no caller can change a value for the others.
+    """
+    out_bits = tuple(enumerate(out_labels))
+
+    @functools.lru_cache(maxsize=_MAX_SHARED_VALUES)
+    def shared_value(result: Optional[int]) -> Mapping:
+        if result is None:
+            return MappingProxyType(dict.fromkeys(out_labels))
+        return MappingProxyType({out_: bool(result >> i & 1) for i, out_ in out_bits})
+
+    return shared_value
+
 
 class Connection:
     """Represents the connection between the output of some element and the input of
@@ -44,6 +74,9 @@ class Connection:
         the name of the input of the destination element (it can have several inputs)
     """
 
+    # connections are read on every input read, slots make that attribute access cheaper
+    __slots__ = ('source', 'output_label', 'destination', 'input_label')
+
     def __init__(self, source, output_label, destination, input_label):
         self.source = source
         self.output_label = output_label
@@ -51,6 +84,38 @@ class Connection:
         self.input_label = input_label
 
 
+def _to_signal(value) -> Optional[bool]:
+    """Normalize a value from outside the scheme (an int of the parser, a numpy value of
+    a truth table) to bool or None, so that the signals can be packed into ints as they are.
+    """
+    return None if value is None else bool(value)
+
+
+def _predict_packed(function, bits: int, unknown_mask: int) -> Optional[int]:
+    """Return function(bits) if it doesn't depend on the bits set in <unknown_mask>,
+    otherwise None. The unknown bits must be low in <bits>. It is the same rule as in
+    TruthTable.predict_value, but the function is evaluated on ints instead of reading rows.
+    """
+    value = function(bits)
+    # enumerate every nonzero subset of the unknown bits
+    subset = unknown_mask
+    while subset:
+        if function(bits | subset) != value:
+            return None
+        subset = (subset - 1) & unknown_mask
+    return value
+
+
+def _ripple(a: int, b: int, sub: bool, num_bits: int) -> Tuple[int, int]:
+    """Add (or subtract if <sub>) the <num_bits>-bit numbers <a> and <b> the way a ripple-carry
+    adder-subtractor does: B is inverted and sub is the carry into bit 0.
+    Return the <num_bits>-bit result and the carry out of it.
+    """
+    mask = (1 << num_bits) - 1
+    total = a + (b ^ mask if sub else b) + sub
+    return total & mask, total >> num_bits
+
+
 class BasicElement:
     """An abstract class for defining the interface of logic elements.
     Logic element:
@@ -62,7 +127,11 @@ class BasicElement:
     ----------
     value: dict
         a dictionary (each key is a name of the output of the logic element, each value is a
-        boolean) that represents the output of the logic element.
+        boolean) that represents the output of the logic element. Calculated values may be
+        read-only mappings shared with other elements (see calc_value).
+    vector_value: dict
+        the same as value, but each value is an array of np.uint64 words, each bit of which
+        is the output in one of many parallel trials (see calc_vector)
     position: tuple
         Cell that element posses on separated square.
         First cell has position (1, 1)
@@ -78,42 +147,92 @@ class BasicElement:
         Delete the connection associated with the specified input
     set_output_connection(connection)
         Add passed in connection to the connections associated with the specified output
-    delete_output_connection(output_label)
-        Clear all the output connections
+    delete_output_connection(output_label, connection)
+        Delete the passed in connection (or all the connections if it is not passed)
+        associated with the specified output
     calc_value(update)
         Calculate the output of the logic element
+    calc_vector(update)
+        Calculate the output of the logic element in many parallel trials
     """
 
     def __init__(self, id_, position):
         self._ins = {}
+        self._input_labels = ()
+        self._input_index = {}
+        self._input_connections = []
         self._outs = {}
         self.value = {}
+        self.vector_value = {}
         self._id = id_
         self._element_type = None
+        self._is_combinational = True
         self.position = position
 
     def set_input_connection(self, connection: Connection):
         if connection.input_label not in self._ins:
             raise KeyError("No such label in the labels of inputs.")
         self._ins[connection.input_label] = connection
+        if connection.input_label in self._input_index:
+            self._input_connections[self._input_index[connection.input_label]] = connection
 
     def delete_input_connection(self, input_label: str):
         self._ins[input_label] = None
+        if input_label in self._input_index:
+            self._input_connections[self._input_index[input_label]] = UNCONNECTED
 
     def set_output_connection(self, connection: Connection):
         if connection.output_label not in self._outs:
             raise KeyError("No such label in the labels of outputs.")
         self._outs[connection.output_label].append(connection)
 
-    def delete_output_connection(self, output_label: str):
-        self._outs[output_label] = []
+    def delete_output_connection(self, output_label: str, connection: Optional[Connection] = None):
+        if connection is None:
+            self._outs[output_label] = []
+        elif connection in self._outs[output_label]:
+            self._outs[output_label].remove(connection)
 
     def _init_value(self):
         self.value = {out_: None for out_ in self._outs}
 
-    def calc_value(self, update=True) -> dict:
+    def _index_inputs(self):
+        """Number the inputs in the order they were added, so that hot paths can read
+        the connections from the list _input_connections instead of the dictionary _ins.
+        Unconnected inputs are UNCONNECTED in the list, so reading them needs no check.
+        """
+        self._input_labels = tuple(self._ins)
+        self._input_index = {label: idx for idx, label in enumerate(self._input_labels)}
+        self._input_connections = [UNCONNECTED if connection is None else connection
+                                   for connection in self._ins.values()]
+
+    def _init_out_values(self):
+        """Use the possible values of an element with the single output 'out' that are built
+        once, so that calc_value returns one of them instead of allocating a new dictionary
+        on every call. The values are read-only, since all such elements share them.
+        """
+        self._out_values = _SINGLE_OUT_VALUES
+
+    def _init_shared_values(self):
+        """Cache the values of a multi-output element, so that calc_value returns the same
+        read-only mapping for the same result instead of allocating a new dictionary on every
+        call (see _shared_values_of). Output i of the value is bit i of the result.
+        """
+        self._shared_value = _shared_values_of(tuple(self._outs))
+
+    def calc_value(self, update=True) -> Mapping:
+        """Calculate the output of the element from the values of the sources of its inputs
+        and store it in value if <update>. The result may be shared with other calls and
+        elements, so it must not be changed; copy it with dict() to get a changeable one.
+        """
         raise NotImplementedError
 
+    def calc_vector(self, update=True) -> dict:
+        """Calculate the output like calc_value does, but for the words of parallel trials
+        stored in vector_value of the sources. Bitwise operations on the words evaluate
+        64 trials at once. All the inputs must be connected.
+        """
+        raise NotImplementedError(f"Element type <{self._element_type}> can't be evaluated in parallel")
+
     @property
     def id(self):
         return self._id
@@ -122,17 +241,44 @@ class BasicElement:
     def element_type(self):
         return self._element_type
 
+    @property
+    def is_combinational(self):
+        """True if the output depends only on the current inputs (the element has no state
+        and no value that can be switched)
+        """
+        return self._is_combinational
+
     def _read_input_value(self, input_label: str):
         connection = self._ins[input_label]
         if connection is None:
             return None
         return connection.source.value[connection.output_label]
 
+    def _read_input_vector(self, input_label: str):
+        connection = self._ins[input_label]
+        if connection is None:
+            raise ValueError(f"Input <{input_label}> of element <{self._id}> is not connected")
+        return connection.source.vector_value[connection.output_label]
+
+    @staticmethod
+    def _read_packed_input(connections, shift: int = 0):
+        """Pack the values read through <connections> (a slice of _input_connections) into ints:
+        bit (shift + i) of the first int is the value of the i-th connection, the same bit
+        of the second int is set if it is unknown.
+        """
+        bits = 0
+        unknown_mask = 0
+        for i, connection in enumerate(connections, shift):
+            value = connection.source.value[connection.output_label]
+            if value is None:
+                unknown_mask |= 1 << i
+            else:
+                bits |= value << i  # signals are bools (see _to_signal)
+        return bits, unknown_mask
+
     def _get_input_values(self):
-        input_values = {}
-        for label in self._ins:
-            input_values[label] = self._read_input_value(label)
-        return input_values
+        return {label: None if connection is None else connection.source.value[connection.output_label]
+                for label, connection in self._ins.items()}
 
     @property
     def outs(self):
@@ -157,6 +303,17 @@ class BasicLogicGate(BasicElement):
         out
     """
 
+    def __init_subclass__(cls, **kwargs):
+        """Most of the gates have two inputs, so every gate class gets a table of its output
+        for each pair of input values (False, True or None), which calc_value uses instead
+        of the general _logic_of_element.
+        """
+        super().__init_subclass__(**kwargs)
+        if '_logic_of_element' in cls.__dict__:
+            cls._two_inputs_table = {(first, second): cls._logic_of_element(first, second)
+                                     for first in (False, True, None)
+                                     for second in (False, True, None)}
+
     def __init__(self, id_, position, num_inputs: int):
         """Initialize an instance with num_inputs.
         :id_: name or id of the element
@@ -166,68 +323,133 @@ class BasicLogicGate(BasicElement):
             raise ValueError("Number of inputs should be >= 2")
         super().__init__(id_, position)
         self._num_inputs = num_inputs
-        for i in range(1, num_inputs + 1):
-            self._ins['in' + str(i)] = None
+        self._ins = dict.fromkeys([f'in{i}' for i in range(1, num_inputs + 1)])
         self._outs['out'] = []
-        self._truth_table = TruthTable(list(self._ins), ['out'], lambda lst: self._logic_of_element(*lst))
+        self._truth_table_cache = None
+        self._index_inputs()
+        self._init_out_values()
         self._init_value()
 
-    def _logic_of_element(self, *inputs) -> bool:
+    @property
+    def _truth_table(self):
+        """The truth table is only needed for inspection, so it is built on first access
+        instead of in __init__ (it has 2**num_inputs rows).
+        """
+        if self._truth_table_cache is None:
+            self._truth_table_cache = TruthTable(list(self._input_labels), ['out'],
+                                                 lambda lst: [self._logic_of_element(*lst)])
+        return self._truth_table_cache
+
+    @staticmethod
+    def _logic_of_element(*inputs) -> Optional[bool]:
+        """Calculate the output of the gate. Inputs that are None are unknown, and the output
+        is None only if it depends on them.
+        """
         raise NotImplementedError
 
-    def _iterate_over_input_values(self):
-        for input_label in self._ins:
-            yield input_label, self._read_input_value(input_label)
+    # the ufunc that combines the words of the inputs in calc_vector, and whether its result is inverted
+    _vector_operation = None
+    _vector_inverted = False
+
+    def _vector_logic_of_element(self, *inputs):
+        if len(inputs) == 2:
+            # the common case, one ufunc call without stacking the inputs
+            words = self._vector_operation(*inputs)
+        else:
+            words = self._vector_operation.reduce(np.broadcast_arrays(*inputs))
+        return ~words if self._vector_inverted else words
 
     def calc_value(self, update=True):
-        value = self._truth_table.predict_value(dict(self._iterate_over_input_values()))
+        if self._num_inputs == 2:
+            first, second = self._input_connections
+            value = self._out_values[self._two_inputs_table[first.source.value[first.output_label],
+                                                            second.source.value[second.output_label]]]
+        else:
+            input_values = [connection.source.value[connection.output_label]
+                            for connection in self._input_connections]
+            value = self._out_values[self._logic_of_element(*input_values)]
         if update:
             self.value = value
         return value
 
+    def calc_vector(self, update=True):
+        value = {'out': self._vector_logic_of_element(*map(self._read_input_vector, self._input_labels))}
+        if update:
+            self.vector_value = value
+        return value
+
 class AndGate(BasicLogicGate):
+    _vector_operation = np.bitwise_and
+
     def __init__(self, id_, position=None, num_inputs=2):
         super().__init__(id_, position, num_inputs)
         self._element_type = "AND"
 
-    def _logic_of_element(self, *inputs):
-        return functools.reduce(lambda a, b: a and b, inputs)
+    @staticmethod
+    def _logic_of_element(*inputs):
+        # the first low input decides the output, the inputs after it aren't compared
+        if False in inputs:
+            return False
+        return None if None in inputs else True
 
 
 class OrGate(BasicLogicGate):
+    _vector_operation = np.bitwise_or
+
     def __init__(self, id_, position=None, num_inputs=2):
         super().__init__(id_, position, num_inputs)
         self._element_type = "OR"
 
-    def _logic_of_element(self, *inputs):
-        return functools.reduce(lambda a, b: a or b, inputs)
+    @staticmethod
+    def _logic_of_element(*inputs):
+        if True in inputs:
+            return True
+        return None if None in inputs else False
 
 
 class XorGate(BasicLogicGate):
+    _vector_operation = np.bitwise_xor
+
     def __init__(self, id_, position=None, num_inputs=2):
         super().__init__(id_, position, num_inputs)
         self._element_type = "XOR"
 
-    def _logic_of_element(self, *inputs):
-        return functools.reduce(lambda a, b: a != b, inputs)
+    @staticmethod
+    def _logic_of_element(*inputs):
+        if None in inputs:
+            return None
+        # parity of the number of high inputs, counted in C
+        return bool(inputs.count(True) & 1)
 
 
 class NandGate(BasicLogicGate):
+    _vector_operation = np.bitwise_and
+    _vector_inverted = True
+
     def __init__(self, id_, position=None, num_inputs=2):
         super().__init__(id_, position, num_inputs)
         self._element_type = "NAND"
 
-    def _logic_of_element(self, *inputs):
-        return not functools.reduce(lambda a, b: a and b, inputs)
+    @staticmethod
+    def _logic_of_element(*inputs):
+        if False in inputs:
+            return True
+        return None if None in inputs else False
 
 
 class NorGate(BasicLogicGate):
+    _vector_operation = np.bitwise_or
+    _vector_inverted = True
+
     def __init__(self, id_, position=None, num_inputs=2):
         super().__init__(id_, position, num_inputs)
         self._element_type = "NOR"
 
-    def _logic_of_element(self, *inputs):
-        return not functools.reduce(lambda a, b: a or b, inputs)
+    @staticmethod
+    def _logic_of_element(*inputs):
+        if True in inputs:
+            return False
+        return None if None in inputs else True
 
 
 class NotGate(BasicElement):
@@ -244,19 +466,27 @@ class NotGate(BasicElement):
         self._ins['in'] = None
         self._outs['out'] = []
         self._element_type = "NOT"
+        self._index_inputs()
+        self._init_out_values()
         self._init_value()
 
     def calc_value(self, update=True):
-        input_value = self._read_input_value('in')
+        connection = self._input_connections[0]
+        input_value = connection.source.value[connection.output_label]
         if input_value is None:
-            value = None
+            value = self._out_values[None]
         else:
-            value = not input_value
-        value = {'out': value}
+            value = self._out_values[not input_value]
         if update:
             self.value = value
         return value
 
+    def calc_vector(self, update=True):
+        value = {'out': ~self._read_input_vector('in')}
+        if update:
+            self.vector_value = value
+        return value
+
 
 class Constant(BasicElement):
     """A class for constant source of signal.
@@ -270,18 +500,30 @@ class Constant(BasicElement):
         """Initialize a constant with its value and id and position.
         """
         super().__init__(id_, position)
-        self._constant_value = constant_value
+        self._constant_value = _to_signal(constant_value)
         self._outs['out'] = []
         self._element_type = "CONSTANT"
-        self.value = {'out': self._constant_value}
+        # the value never changes, so the same read-only mapping is returned by every calc_value call
+        self._constant_out = MappingProxyType({'out': self._constant_value})
+        self.value = self._constant_out
 
     def calc_value(self, update=True):
-        value = {'out': self._constant_value}
         if update:
-            self.value = value
+            self.value = self._constant_out
+        return self._constant_out
+
+    def calc_vector(self, update=True):
+        value = {'out': ALL_LANES if self._constant_value else NO_LANES}
+        if update:
+            self.vector_value = value
         return value
 
 
+# the connection that unconnected inputs point to in BasicElement._input_connections,
+# its source always outputs None
+UNCONNECTED = Connection(Constant('unconnected', constant_value=None), 'out', None, None)
+
+
 class Variable(BasicElement):
     """A class for variable source of signal.
     The interface of the element is the following:
@@ -294,16 +536,17 @@ class Variable(BasicElement):
         """Initialize a variable source of signal with its initial value, id and position.
         """
         super().__init__(id_, position)
-        self._variable_value = init_value
+        self._variable_value = _to_signal(init_value)
         self._outs['out'] = []
         self._element_type = "VARIABLE"
-        self.value = {'out': init_value}
+        self._is_combinational = False
+        self.value = {'out': self._variable_value}
 
     def switch(self, value: Optional[bool] = None):
         if value is None:
             self._variable_value = not self._variable_value
         else:
-            self._variable_value = value
+            self._variable_value = bool(value)
         self.calc_value()
 
     def calc_value(self, update=True):
@@ -312,6 +555,15 @@ class Variable(BasicElement):
             self.value = value
         return value
 
+    def calc_vector(self, update=True):
+        """Broadcast the current value to all the trials. To vary the variable between
+        trials, assign its words to vector_value instead (see Scheme.run_vector).
+        """
+        value = {'out': ALL_LANES if self._variable_value else NO_LANES}
+        if update:
+            self.vector_value = value
+        return value
+
 class Multiplexer(BasicElement):
     """A class for multiplexer element.
     A multiplexer has n select lines and 2**n input lines. The select lines decide signal from
@@ -337,29 +589,67 @@ class Multiplexer(BasicElement):
             raise ValueError("Number of select lines must be >= 1")
         super().__init__(id_, position)
         self._num_select_lines = num_select_lines
-        for i in range(1, num_select_lines + 1):
-            self._ins[f'sel{i}'] = None
-        for i in range(1, 2 ** num_select_lines + 1):
-            self._ins[f'in{i}'] = None
+        self._select_labels = tuple(f'sel{i}' for i in range(1, num_select_lines + 1))
+        self._data_labels = tuple(f'in{i}' for i in range(1, (1 << num_select_lines) + 1))
+        self._ins = dict.fromkeys(self._select_labels + self._data_labels)
         self._outs['out'] = []
         self._element_type = "MULTIPLEXER"
-        self._truth_table = TruthTable.get_multiplexer_truth_table(num_select_lines=num_select_lines)
+        self._index_inputs()
+        self._init_out_values()
         self._init_value()
 
     @property
     def number_select_lines(self):
         return self._num_select_lines
 
+    @staticmethod
+    def _select(select, low, high):
+        """2:1 multiplexer. If the select line is unknown the output is known only when
+        both candidates are the same.
+        """
+        if select is None:
+            return low if low == high else None
+        return high if select else low
+
     def calc_value(self, update=True):
-        value = self._truth_table.predict_value(self._get_input_values())
+        # inputs are indexed as sel1, ..., sel{n}, in1, ..., in{2**n}; sel1 is the lowest bit
+        # of the number of the selected input line
+        num_select_lines = self._num_select_lines
+        selected, unknown_mask = self._read_packed_input(self._input_connections[:num_select_lines])
+        if not unknown_mask:
+            # only the selected input line is read
+            connection = self._input_connections[num_select_lines + selected]
+            value = self._out_values[connection.source.value[connection.output_label]]
+        else:
+            input_values = [connection.source.value[connection.output_label]
+                            for connection in self._input_connections]
+            selects = input_values[:num_select_lines]
+            candidates = input_values[num_select_lines:]
+            # every select line halves the candidates: sel1 chooses between in1 and in2, in3 and in4, ...
+            for select in selects:
+                candidates = [self._select(select, low, high)
+                              for low, high in zip(candidates[::2], candidates[1::2])]
+            value = self._out_values[candidates[0]]
         if update:
             self.value = value
         return value
 
+    def calc_vector(self, update=True):
+        candidates = [self._read_input_vector(label) for label in self._data_labels]
+        # every select line halves the candidates: sel1 chooses between in1 and in2, in3 and in4, ...
+        for label in self._select_labels:
+            select = self._read_input_vector(label)
+            candidates = [(low & ~select) | (high & select)
+                          for low, high in zip(candidates[::2], candidates[1::2])]
+        value = {'out': candidates[0]}
+        if update:
+            self.vector_value = value
+        return value
+
 class Encoder(BasicElement):
     """A class for encoder element.
     An encoder knows the number of the high input line, and outputs this number represented by n output lines.
-    If several input lines are high, this implementation of encoder takes into account the first one that is high.
+    If several input lines are high, the output is the bitwise OR of their numbers (as in an encoder made of OR gates).
     If none of input lines are high, then the all the output lines are low.
     The interface of the encoder element is the following:
     - input:
@@ -381,24 +671,53 @@ class Encoder(BasicElement):
             raise ValueError("Number of output lines must be >= 1")
         super().__init__(id_, position)
         self._num_output_lines = num_output_lines
-        for i in range(1, 2 ** num_output_lines + 1):
-            self._ins[f'input_line_{i}'] = None
-        for i in range(1, num_output_lines + 1):
-            self._outs[f'output_line_{i}'] = []
+        self._in_labels = [f'input_line_{i}' for i in range(1, (1 << num_output_lines) + 1)]
+        self._out_labels = [f'output_line_{i}' for i in range(1, num_output_lines + 1)]
+        self._ins = dict.fromkeys(self._in_labels)
+        self._outs = {out_label: [] for out_label in self._out_labels}
+        # for each output line, the numbers of the input lines whose numbers have its bit
+        self._lines_of_outputs = tuple((out_label, [number for number in range(len(self._in_labels))
+                                                    if number >> i & 1])
+                                       for i, out_label in enumerate(self._out_labels))
         self._element_type = "ENCODER"
-        self._truth_table = TruthTable.get_encoder_truth_table(num_output_lines)
+        self._index_inputs()
+        self._init_shared_values()
         self._init_value()
 
     @property
     def number_output_lines(self):
         return self._num_output_lines
 
+    @staticmethod
+    def _or_of_line_numbers(lines: int) -> int:
+        """Return the bitwise OR of the numbers (starting from 0) of the lines set in <lines>"""
+        number = 0
+        while lines:
+            lowest = lines & -lines
+            number |= lowest.bit_length() - 1
+            lines ^= lowest
+        return number
+
     def calc_value(self, update=True):
-        value = self._truth_table.predict_value(self._get_input_values())
+        lines, unknown_lines = self._read_packed_input(self._input_connections)
+        number = self._or_of_line_numbers(lines)
+        # unknown lines can only add bits to the number, the output is known if they add none
+        if self._or_of_line_numbers(unknown_lines) | number != number:
+            number = None
+        value = self._shared_value(number)
         if update:
             self.value = value
         return value
 
+    def calc_vector(self, update=True):
+        lines = [self._read_input_vector(label) for label in self._in_labels]
+        # output line i is the OR of the input lines whose numbers have bit i
+        value = {out_label: np.bitwise_or.reduce(np.broadcast_arrays(*(lines[number] for number in numbers)))
+                 for out_label, numbers in self._lines_of_outputs}
+        if update:
+            self.vector_value = value
+        return value
+
 class Decoder(BasicElement):
     """A class for decoder element.
     A decoder reads the number represented by n input lines and based on that turns on
@@ -423,12 +742,13 @@ class Decoder(BasicElement):
             raise ValueError("Number of input lines must be >= 1")
         super().__init__(id_, position)
         self._num_input_lines = num_input_lines
-        for i in range(num_input_lines):
-            self._ins[f'in{i}'] = None
-        for i in range(2 ** num_input_lines):
-            self._outs[f'out{i}'] = []
+        self._in_labels = [f'in{i}' for i in range(num_input_lines)]
+        self._out_labels = [f'out{i}' for i in range(1 << num_input_lines)]
+        self._ins = dict.fromkeys(self._in_labels)
+        self._outs = {out_label: [] for out_label in self._out_labels}
         self._element_type = "DECODER"
-        self._truth_table = TruthTable.get_decoder_truth_table(num_input_lines=num_input_lines)
+        self._index_inputs()
+        self._init_shared_values()
         self._init_value()
 
     @property
@@ -436,11 +756,24 @@ class Decoder(BasicElement):
         return self._num_input_lines
 
     def calc_value(self, update=True):
-        value = self._truth_table.predict_value(self._get_input_values())
+        number, unknown_mask = self._read_packed_input(self._input_connections)
+        # every unknown input line moves the high output line
+        value = self._shared_value(None if unknown_mask else 1 << number)
         if update:
             self.value = value
         return value
 
+    def calc_vector(self, update=True):
+        # products[number] is high in the trials where the input lines read so far make <number>
+        products = [ALL_LANES]
+        for label in self._in_labels:
+            line = self._read_input_vector(label)
+            products = [product & ~line for product in products] + [product & line for product in products]
+        value = dict(zip(self._out_labels, products))
+        if update:
+            self.vector_value = value
+        return value
+
 
 class FullAdder(BasicElement):
     """A class for full adder element.
@@ -466,15 +799,32 @@ class FullAdder(BasicElement):
         self._outs['S'] = []
         self._outs['Cout'] = []
         self._element_type = "FULLADDER"
-        self._truth_table = TruthTable.get_fulladder_truth_table()
+        self._index_inputs()
+        self._init_shared_values()
         self._init_value()
 
+    @staticmethod
+    def _add_bits(packed: int) -> int:
+        """<packed> holds A, B and Cin in bits 0, 1 and 2. Return the sum: S in bit 0, Cout in bit 1"""
+        return (packed & 1) + (packed >> 1 & 1) + (packed >> 2)
+
     def calc_value(self, update=True):
-        value = self._truth_table.predict_value(self._get_input_values())
+        bits, unknown_mask = self._read_packed_input(self._input_connections)
+        value = self._shared_value(_predict_packed(self._add_bits, bits, unknown_mask))
         if update:
             self.value = value
         return value
 
+    def calc_vector(self, update=True):
+        bit_a = self._read_input_vector('A')
+        bit_b = self._read_input_vector('B')
+        carry_in = self._read_input_vector('Cin')
+        half_sum = bit_a ^ bit_b
+        value = {'S': half_sum ^ carry_in, 'Cout': (bit_a & bit_b) | (carry_in & half_sum)}
+        if update:
+            self.vector_value = value
+        return value
+
 
 class AdderSubtractor(BasicElement):
     """A class for adder-subtractor element.
@@ -506,27 +856,64 @@ class AdderSubtractor(BasicElement):
             raise ValueError("Number of bits must be >= 1")
         super().__init__(id_, position)
         self._num_bits = num_bits
-        for i in range(num_bits):
-            self._ins[f'A{i}'] = None
-            self._ins[f'B{i}'] = None
+        self._bits_mask = (1 << num_bits) - 1
+        self._a_labels = [f'A{i}' for i in range(num_bits)]
+        self._b_labels = [f'B{i}' for i in range(num_bits)]
+        self._s_labels = [f'S{i}' for i in range(num_bits)]
+        # A and B inputs go in pairs: A0, B0, A1, B1, ..., sub
+        self._ins = dict.fromkeys([label for pair in zip(self._a_labels, self._b_labels) for label in pair])
         self._ins['sub'] = None
-        for i in range(num_bits):
-            self._outs[f'S{i}'] = []
+        self._outs = {s_label: [] for s_label in self._s_labels}
         self._outs['Cout'] = []
+        self._bit_labels = tuple(zip(self._a_labels, self._b_labels, self._s_labels))
         self._element_type = "ADDERSUBTRACTOR"
-        self._truth_table = TruthTable.get_addersubtractor_truth_table(num_bits)
+        self._index_inputs()
+        self._init_shared_values()
         self._init_value()
 
     @property
     def number_bits(self):
         return self._num_bits
 
+    def _add_or_subtract(self, packed: int) -> int:
+        """<packed> holds A in bits 0..n-1, B in bits n..2n-1 and sub in bit 2n.
+        Return S in bits 0..n-1 and Cout in bit n.
+        """
+        num_bits = self._num_bits
+        total, carry = _ripple(packed & self._bits_mask, (packed >> num_bits) & self._bits_mask,
+                               packed >> (2 * num_bits), num_bits)
+        return total | carry << num_bits
+
     def calc_value(self, update=True):
-        value = self._truth_table.predict_value(self._get_input_values())
+        # inputs are indexed as A0, B0, A1, B1, ..., sub
+        connections = self._input_connections
+        num_bits = self._num_bits
+        a, a_unknown = self._read_packed_input(connections[0:2 * num_bits:2])
+        b, b_unknown = self._read_packed_input(connections[1:2 * num_bits:2], num_bits)
+        sub, sub_unknown = self._read_packed_input(connections[2 * num_bits:], 2 * num_bits)
+        # outputs are S0, ..., S{n-1}, Cout, so they are the bits of the result in order
+        value = self._shared_value(_predict_packed(self._add_or_subtract, a | b | sub,
+                                                   a_unknown | b_unknown | sub_unknown))
         if update:
             self.value = value
         return value
 
+    def calc_vector(self, update=True):
+        # ripple carry over the words; subtraction adds the inverted B and 1
+        sub = self._read_input_vector('sub')
+        carry = sub
+        value = {}
+        for a_label, b_label, s_label in self._bit_labels:
+            bit_a = self._read_input_vector(a_label)
+            bit_b = self._read_input_vector(b_label) ^ sub
+            half_sum = bit_a ^ bit_b
+            value[s_label] = half_sum ^ carry
+            carry = (bit_a & bit_b) | (carry & half_sum)
+        value['Cout'] = carry
+        if update:
+            self.vector_value = value
+        return value
+
 
 class RightShifter(BasicElement):
     """A class for right shifter element.
@@ -558,30 +945,60 @@ class RightShifter(BasicElement):
             raise ValueError("Number of bits must be >= 2")
         super().__init__(id_, position=position)
         self._num_bits = num_bits
-        for i in range(num_bits):
-            self._ins[f'in{i}'] = None
-            self._ins[f'shift_line{i}'] = None
-            self._outs[f'out{i}'] = []
+        self._bits_mask = (1 << num_bits) - 1
+        self._in_labels = [f'in{i}' for i in range(num_bits)]
+        self._shift_labels = [f'shift_line{i}' for i in range(num_bits)]
+        self._out_labels = [f'out{i}' for i in range(num_bits)]
+        # inputs go in pairs: in0, shift_line0, in1, shift_line1, ...
+        self._ins = dict.fromkeys([label for pair in zip(self._in_labels, self._shift_labels) for label in pair])
+        self._outs = {out_label: [] for out_label in self._out_labels}
         self._element_type = "SHIFTER"
-        self._truth_table = TruthTable.get_rightshifter_truth_table(num_bits=num_bits)
+        self._index_inputs()
+        self._init_shared_values()
         self._init_value()
 
-    def _read_input(self, base: str):
-        number = []
-        for i in range(self._num_bits):
-            number.append(self._read_input_value(base + str(i)))
-        return number
-
     @property
     def number_bits(self):
         return self._num_bits
 
+    def _shift(self, packed: int) -> int:
+        """<packed> holds the inputs in bits 0..n-1 and the shift lines in bits n..2n-1.
+        Every high shift line j moves the inputs by j bits (out{i} gets in{i-j}),
+        and the outputs are the OR of all the moved inputs.
+        """
+        to_shift = packed & self._bits_mask
+        shift_by = packed >> self._num_bits
+        result = 0
+        while shift_by:
+            lowest = shift_by & -shift_by
+            result |= to_shift * lowest  # to_shift << j for lowest == 1 << j
+            shift_by ^= lowest
+        return result & self._bits_mask
+
     def calc_value(self, update=True):
-        value = self._truth_table.predict_value(self._get_input_values())
+        # inputs are indexed as in0, shift_line0, in1, shift_line1, ...
+        to_shift, to_shift_unknown = self._read_packed_input(self._input_connections[0::2])
+        shift_by, shift_by_unknown = self._read_packed_input(self._input_connections[1::2], self._num_bits)
+        value = self._shared_value(_predict_packed(self._shift, to_shift | shift_by,
+                                                   to_shift_unknown | shift_by_unknown))
         if update:
             self.value = value
         return value
 
+    def calc_vector(self, update=True):
+        to_shift = [self._read_input_vector(label) for label in self._in_labels]
+        shift_by = [self._read_input_vector(label) for label in self._shift_labels]
+        value = {}
+        for i, out_label in enumerate(self._out_labels):
+            # out{i} gets in{i-j} if shift line j is high
+            out = to_shift[i] & shift_by[0]
+            for j in range(1, i + 1):
+                out = out | (to_shift[i - j] & shift_by[j])
+            value[out_label] = out
+        if update:
+            self.vector_value = value
+        return value
+
 
 class ForbiddenSrLatchStateError(Exception):
     """
@@ -624,6 +1041,7 @@ class GatedSRFlipFlop(BasicElement):
         self._ins['E'] = None
         self._outs[f'Q'] = []
         self._element_type = "SR_FLIPFLOP"
+        self._is_combinational = False
         self._state = None
         self._truth_table = TruthTable.get_gated_sr_flipflop_truth_table()
         self._init_value()
@@ -631,9 +1049,9 @@ class GatedSRFlipFlop(BasicElement):
     def calc_value(self, update=True):
         in_vals = self._get_input_values()
         in_vals['prev_state'] = self._state
-        value = self._truth_table.predict_value(in_vals)
-        self._state = None if value['next_state'] == -1 else value['next_state']
-        del value['next_state']
+        prediction = self._truth_table.predict_value(in_vals)
+        self._state = None if prediction['next_state'] == -1 else _to_signal(prediction['next_state'])
+        value = {'Q': _to_signal(prediction['Q'])}
         if update:
             self.value = value
         return value
@@ -663,6 +1081,7 @@ class GatedDFlipFlop(BasicElement):
         self._ins[f'E'] = None
         self._outs[f'Q'] = []
         self._element_type = "D_FLIPFLOP"
+        self._is_combinational = False
         self._state = None
         self._truth_table = TruthTable.get_gated_d_flipflop_truth_table()
         self._init_value()
@@ -670,9 +1089,9 @@ class GatedDFlipFlop(BasicElement):
     def calc_value(self, update=True):
         in_vals = self._get_input_values()
         in_vals['prev_state'] = self._state
-        value = self._truth_table.predict_value(in_vals)
-        self._state = None if value['next_state'] == -1 else value['next_state']
-        del value['next_state']
+        prediction = self._truth_table.predict_value(in_vals)
+        self._state = None if prediction['next_state'] == -1 else _to_signal(prediction['next_state'])
+        value = {'Q': _to_signal(prediction['Q'])}
         if update:
             self.value = value
         return value
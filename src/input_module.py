@@ -10,13 +10,14 @@ class InputParser:
                               'o': 'num_output_lines',
                               'i': 'num_input_lines',
                               'b': 'num_bits'}
-        self._match_scheme_commands = {'add': self._scheme.add_element,
-                                       'del': self._scheme.delete_element,
-                                       'switch': None,
-                                       '>': self._scheme.add_connection,
-                                       '!>': self._scheme.delete_connection,
-                                       'clear': self._scheme.clear,
-                                       'assert': None}
+        # handlers of the commands, each takes the parts of the command and its keyword arguments
+        self._match_scheme_commands = {'add': self._add_element,
+                                       'del': self._delete_element,
+                                       'switch': self._switch,
+                                       '>': self._add_connection,
+                                       '!>': self._delete_connection,
+                                       'clear': self._clear,
+                                       'assert': self._assert}
         self._match_num_main_params = {'add': 5,
                                        'del': 2,
                                        'switch': 2,
@@ -90,23 +91,28 @@ class InputParser:
                 value = args_values[2 * i + 1]
                 kwargs[self._match_kwargs[arg]] = int(value)
 
-        if command == 'add':
-            self._scheme.add_element(parts[1], parts[2],
-                                     (int(parts[3]), int(parts[4])), **kwargs)
-        elif command == 'del':
-            self._scheme.delete_element(parts[1])
-        elif command == 'switch':
-            self._scheme[parts[1]].switch(int(parts[2]) if len(parts) > 2 else None)
-        elif command == '>':
-            self._scheme.add_connection(parts[0], parts[1], parts[3], parts[4])
-        elif command == '!>':
-            self._scheme.delete_connection(parts[0], parts[1], parts[3], parts[4])
-        elif command == 'clear':
-            self._scheme.clear()
-        elif command == 'assert':
-            if parts[3] == "U":
-                parts[3] = None
-            else:
-                parts[3] = int(parts[3])
-            self._scheme.run()
-            return str(self._scheme[parts[1]].value[parts[2]] == parts[3]) + "\n"
+        return self._match_scheme_commands[command](parts, kwargs)
+
+    def _add_element(self, parts, kwargs):
+        self._scheme.add_element(parts[1], parts[2],
+                                 (int(parts[3]), int(parts[4])), **kwargs)
+
+    def _delete_element(self, parts, kwargs):
+        self._scheme.delete_element(parts[1])
+
+    def _switch(self, parts, kwargs):
+        self._scheme[parts[1]].switch(int(parts[2]) if len(parts) > 2 else None)
+
+    def _add_connection(self, parts, kwargs):
+        self._scheme.add_connection(parts[0], parts[1], parts[3], parts[4])
+
+    def _delete_connection(self, parts, kwargs):
+        self._scheme.delete_connection(parts[0], parts[1], parts[3], parts[4])
+
+    def _clear(self, parts, kwargs):
+        self._scheme.clear()
+
+    def _assert(self, parts, kwargs):
+        expected = None if parts[3] == "U" else int(parts[3])
+        self._scheme.run()
+        return str(self._scheme[parts[1]].value[parts[2]] == expected) + "\n"
@@ -4,9 +4,31 @@ scheme.py
 Implements Scheme class and related exceptions
 '''
 
-from typing import Tuple
-import copy
+from typing import Tuple, Dict, Sequence, Optional
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import src.elements as elements
+from src.compiled_scheme import CompiledScheme
+
+# classes of the elements by the lowercase names of their types (see Scheme.add_element)
+_ELEM_TYPE_MAP = {
+    'multiplexer': elements.Multiplexer,
+    'and': elements.AndGate,
+    'or': elements.OrGate,
+    'not': elements.NotGate,
+    'nor': elements.NorGate,
+    'xor': elements.XorGate,
+    'nand': elements.NandGate,
+    'constant': elements.Constant,
+    'variable': elements.Variable,
+    'decoder': elements.Decoder,
+    'encoder': elements.Encoder,
+    'fulladder': elements.FullAdder,
+    'addersubtractor': elements.AdderSubtractor,
+    'shifter': elements.RightShifter,
+    'srflipflop': elements.GatedSRFlipFlop,
+    'dflipflop': elements.GatedDFlipFlop
+}
 
 
 class IdIsAlreadyTakenError(Exception):
@@ -60,6 +82,173 @@ class WrongElementTypeError(Exception):
         self.message = f'Element type <{element_type}> is does not exist or is not supported'
         super().__init__(self.message)
 
+class CyclicSchemeError(Exception):
+    '''
+    This exception is raised when a scheme with cycles (e.g. a latch) is evaluated
+    in a way that only supports combinational schemes
+    '''
+    def __init__(self):
+        self.message = 'The scheme contains cycles'
+        super().__init__(self.message)
+
+
+def _pack_lanes(values: Sequence[bool]) -> np.ndarray:
+    '''
+    Packs a sequence of booleans into np.uint64 words, 64 trials (lanes) per word.
+    Trial i is bit i % 64 of the word i // 64
+    '''
+    bits = np.asarray(values, dtype=bool)
+    padded = np.zeros(-(-len(bits) // 64) * 64, dtype=bool)
+    padded[:len(bits)] = bits
+    return np.packbits(padded, bitorder='little').view('<u8')
+
+
+def _unpack_lanes(words, num_lanes: int) -> np.ndarray:
+    '''
+    Reverse of _pack_lanes. <words> can also be a single word that applies to all the trials
+    '''
+    words = np.broadcast_to(np.asarray(words, dtype='<u8'), (-(-num_lanes // 64),))
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8),
+                         bitorder='little')[:num_lanes].astype(bool)
+
+
+def _evaluation_order(scheme_elements) -> list:
+    '''
+    Returns <scheme_elements> ordered so that every element goes after the sources of its
+    inputs (iterative post-order DFS over input connections). Connections that close
+    a cycle are skipped, so the function works for sequential schemes as well
+    '''
+    order = []
+    visited = set()
+    for root in scheme_elements:
+        if root.id in visited:
+            continue
+        visited.add(root.id)
+        stack = [(root, iter(root.ins.values()))]
+        while stack:
+            element, in_connections = stack[-1]
+            for in_connection in in_connections:
+                if in_connection is not None and in_connection.source.id not in visited:
+                    source = in_connection.source
+                    visited.add(source.id)
+                    stack.append((source, iter(source.ins.values())))
+                    break
+            else:
+                stack.pop()
+                order.append(element)
+    return order
+
+
+def _is_acyclic(ordered_elements) -> bool:
+    '''
+    Checks that the scheme has no cycles: the DFS of _evaluation_order skips only the connections
+    that close cycles, so the scheme is acyclic if every connection goes forward in
+    <ordered_elements>. O(V+E), the order is not walked again
+    '''
+    position_of = {element.id: position for position, element in enumerate(ordered_elements)}
+    return all(position_of[in_connection.source.id] < position
+               for position, element in enumerate(ordered_elements)
+               for in_connection in element.ins.values()
+               if in_connection is not None)
+
+
+def _evaluation_levels(ordered_elements) -> list:
+    '''
+    Groups elements of a combinational scheme into levels: sources of the inputs of an element
+    are in the previous levels, so the elements of one level don't depend on each other.
+    <ordered_elements> must be in the order of _evaluation_order.
+    Raises CyclicSchemeError if the scheme has cycles
+    '''
+    level_of = {}
+    levels = []
+    for element in ordered_elements:
+        level = 0
+        for in_connection in element.ins.values():
+            if in_connection is None:
+                continue
+            if in_connection.source.id not in level_of:
+                raise CyclicSchemeError()
+            level = max(level, level_of[in_connection.source.id] + 1)
+        level_of[element.id] = level
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(element)
+    return levels
+
+
+def _constant_elements(ordered_elements) -> set:
+    '''
+    Returns ids of the elements whose output can't change until the scheme is edited:
+    combinational elements whose connected inputs all come from such elements (constants
+    and elements without connected inputs included). <ordered_elements> must be in
+    the order of _evaluation_order
+    '''
+    constant_ids = set()
+    for element in ordered_elements:
+        if element.is_combinational and all(in_connection.source.id in constant_ids
+                                            for in_connection in element.ins.values()
+                                            if in_connection is not None):
+            constant_ids.add(element.id)
+    return constant_ids
+
+
+def _connected_components(ordered_elements) -> list:
+    '''
+    Splits the scheme into parts that aren't connected to each other (weakly connected components,
+    union-find over the connections). Returns lists of elements, each in the order of
+    <ordered_elements>, in the order of their first elements
+    '''
+    parent = {element.id: element.id for element in ordered_elements}
+
+    def find(id_):
+        while parent[id_] != id_:
+            parent[id_] = parent[parent[id_]]
+            id_ = parent[id_]
+        return id_
+
+    for element in ordered_elements:
+        for in_connection in element.ins.values():
+            if in_connection is not None:
+                parent[find(in_connection.source.id)] = find(element.id)
+
+    components = {}
+    for element in ordered_elements:
+        components.setdefault(find(element.id), []).append(element)
+    return list(components.values())
+
+
+class _ValueMemo:
+    '''
+    Skips recalculation of the combinational elements whose sources haven't changed since
+    the element was calculated last time. Calculations and changes of values are numbered
+    by one increasing tick, so an element is fresh if all its sources changed before
+    the tick of its last calculation
+    '''
+    def __init__(self, ordered_elements):
+        self._tick = 0
+        self._changed_at = {}
+        self._calculated_at = {}
+        self._sources = {element.id: [in_connection.source.id for in_connection in element.ins.values()
+                                      if in_connection is not None]
+                         for element in ordered_elements if element.is_combinational}
+
+    def calc_value(self, element, update=True) -> dict:
+        '''
+        Returns the value of the element, calculating it only if it can differ from the current one
+        '''
+        sources = self._sources.get(element.id)
+        calculated_at = self._calculated_at.get(element.id)
+        if sources is not None and calculated_at is not None and \
+                all(self._changed_at.get(source_id, -1) < calculated_at for source_id in sources):
+            return element.value
+        self._tick += 1
+        self._calculated_at[element.id] = self._tick
+        return element.calc_value(update)
+
+    def value_changed(self, element_id):
+        self._tick += 1
+        self._changed_at[element_id] = self._tick
+
 
 class Scheme:
     '''
@@ -67,39 +256,62 @@ class Scheme:
     '''
     def __init__(self):
         self._elements = {}
+        # number of changes of the elements and connections; everything derived from them
+        # remembers the tick it was built at and is valid while the tick is the same
+        self._tick = 0
+        self._order = None
+        self._order_tick = -1
+        self._components = None
+        self._components_tick = -1
+        self._compiled = None
+        self._compiled_tick = -1
+        self._compile_error = None
+        # the result of the last run and the key it was calculated for (see _run_key)
+        self._last_run = None
+        self._last_run_key = None
+
+    def _scheme_changed(self):
+        '''
+        Invalidates everything that is derived from the elements and connections of the scheme.
+        Must be called after every change of them
+        '''
+        self._tick += 1
+
+    def _ordered_elements(self) -> list:
+        '''
+        Returns the elements in the order of _evaluation_order. The order is cached
+        until the elements or connections of the scheme change
+        '''
+        if self._order_tick != self._tick:
+            self._order = _evaluation_order(self._elements.values())
+            self._order_tick = self._tick
+        return self._order
+
+    def _ordered_components(self) -> list:
+        '''
+        Returns the parts of the scheme that aren't connected to each other (see
+        _connected_components). The parts are cached like the order
+        '''
+        if self._components_tick != self._tick:
+            self._components = _connected_components(self._ordered_elements())
+            self._components_tick = self._tick
+        return self._components
 
     def add_element(self, element_type: str, element_id: str, position: Tuple[int, int], **kwargs):
         '''
         Validates element_id and element_type, then if they are valid,
         adds new element to the scheme at specified position
         '''
-        elem_type_to_class_dct = {
-            'multiplexer': elements.Multiplexer,
-            'and': elements.AndGate,
-            'or': elements.OrGate,
-            'not': elements.NotGate,
-            'nor': elements.NorGate,
-            'xor': elements.XorGate,
-            'nand': elements.NandGate,
-            'constant': elements.Constant,
-            'variable': elements.Variable,
-            'decoder': elements.Decoder,
-            'encoder': elements.Encoder,
-            'fulladder': elements.FullAdder,
-            'addersubtractor': elements.AdderSubtractor,
-            'shifter': elements.RightShifter,
-            'srflipflop': elements.GatedSRFlipFlop,
-            'dflipflop': elements.GatedDFlipFlop
-        }
         if not self._validate_id(element_id):
             raise IdIsAlreadyTakenError(element_id)
 
-        try:
-            new_element = elem_type_to_class_dct[element_type.lower()](element_id, position, **kwargs)
-        except KeyError as keyerror:
-            raise WrongElementTypeError(element_type) from keyerror
+        element_class = _ELEM_TYPE_MAP.get(element_type.lower())
+        if element_class is None:
+            raise WrongElementTypeError(element_type)
+        new_element = element_class(element_id, position, **kwargs)
 
         self._elements[element_id] = new_element
+        self._scheme_changed()
 
     def _validate_id(self, id_: str) -> bool:
         '''
@@ -108,7 +320,7 @@ class Scheme:
         Return:  True if id is available
                  False if id is already taken
         '''
-        return not id_ in self._elements.keys()
+        return id_ not in self._elements
 
     def add_connection(self, source_id, output_label, destination_id, input_label):
         '''
@@ -131,6 +343,7 @@ class Scheme:
             raise NoSuchOutputLabelError(output_label) from keyerror
 
         destination.set_input_connection(connection)
+        self._scheme_changed()
 
 
     def _validate_connection(self, connection: elements.Connection):
@@ -151,71 +364,276 @@ class Scheme:
         Deletes element from scheme with all conections. Corresponding connections
         of connected elements are set to None
         '''
-        if element_id not in self._elements.keys():
+        if element_id not in self._elements:
             raise NoSuchIdError(element_id)
 
         element = self._elements[element_id]
 
-        for _out in element.outs:
-            for out_connection in element.outs[_out]:
-                out_connection.source.delete_output_connection(out_connection.output_label)
+        for out_label, out_connections in list(element.outs.items()):
+            if not out_connections:
+                continue
+            for out_connection in out_connections:
                 out_connection.destination.delete_input_connection(out_connection.input_label)
+            # all the connections of the output are deleted at once
+            element.delete_output_connection(out_label)
 
-        for _in in element.ins:
-            in_connection = element.ins[_in]
+        for in_connection in list(element.ins.values()):
             if in_connection is None:
                 continue
-            in_connection.source.delete_output_connection(in_connection.output_label)
+            in_connection.source.delete_output_connection(in_connection.output_label, in_connection)
             in_connection.destination.delete_input_connection(in_connection.input_label)
 
         self._elements.pop(element_id)
+        self._scheme_changed()
 
     def delete_connection(self, source_id: str, output_label: str,
                             destination_id: str, input_label: str):
         '''
-        Deletes connection between elements by deliting source output and destination input
+        Deletes connection between elements by deliting source output and destination input.
+        Other connections of the source output are kept
         '''
         source = self._elements[source_id]
         destination = self._elements[destination_id]
 
-        source.delete_output_connection(output_label)
+        connection = destination.ins[input_label]
+        if connection is None or connection.source is not source or connection.output_label != output_label:
+            # there's no such connection
+            return
+        source.delete_output_connection(output_label, connection)
         destination.delete_input_connection(input_label)
+        self._scheme_changed()
 
     def _update_values(self, new_values):
         for id_ in new_values:
             self._elements[id_].value = new_values[id_]
 
+    def _run_compiled(self) -> Optional[Dict]:
+        '''
+        Runs the scheme with CompiledScheme.evaluate_signals if it can be lowered.
+        Return: the result of run, or None if the scheme can't be lowered or some source is unknown
+        '''
+        try:
+            compiled = self.freeze()
+        except (CyclicSchemeError, NotImplementedError, ValueError):
+            return None
+        values = compiled.evaluate_signals()
+        if values is None:
+            return None
+        self._update_values(values)
+        return {element_id: dict(out_values) for element_id, out_values in values.items()}
+
+    def _run_key(self) -> Optional[tuple]:
+        '''
+        Returns what the result of run depends on: the tick and the values of the variables.
+        Returns None if the scheme has flip-flops, since their state changes during the run
+        '''
+        sources = []
+        for element in self._ordered_elements():
+            if not element.is_combinational:
+                if element.element_type != 'VARIABLE':
+                    return None
+                sources.append(element.value['out'])
+        return self._tick, tuple(sources)
+
     def run(self):
+        # nothing has changed since the last run, so its result is still valid
+        run_key = self._run_key()
+        if run_key is not None and run_key == self._last_run_key:
+            return {element_id: dict(out_values) for element_id, out_values in self._last_run.items()}
+        final_out_values = self._run()
+        self._last_run_key = run_key
+        self._last_run = {element_id: dict(out_values) for element_id, out_values in final_out_values.items()}
+        return final_out_values
+
+    def _run(self):
+        # schemes of gates and multiplexers with known sources are two-valued, so they
+        # are evaluated by the compiled scheme in one loop
+        final_out_values = self._run_compiled()
+        if final_out_values is not None:
+            return final_out_values
+
+        # the parts that aren't connected settle independently, and each of them repeats
+        # with its own period, which is shorter than the period of the whole scheme
+        num_passes = len(self._ordered_elements())
+        final_out_values = {}
+        for component in self._ordered_components():
+            final_out_values.update(self._run_component(component, num_passes))
+        return final_out_values
+
+    def _run_component(self, order: list, num_passes: int) -> dict:
+        '''
+        Runs a part of the scheme that isn't connected to the rest of it. <order> is the part
+        in the order of _evaluation_order, <num_passes> is the number of the warm-up passes
+        '''
+        is_acyclic = _is_acyclic(order)
+
+        # fold the constant part of the scheme: evaluate it once and leave it out of the passes
+        constant_ids = _constant_elements(order)
         values_to_update = {}
-        for _ in range(len(self._elements)):
-            for id_ in self._elements:
-                values_to_update[id_] = self._elements[id_].calc_value(update=False)
+        for element in order:
+            if element.id in constant_ids:
+                values_to_update[element.id] = element.calc_value()
+        order = [element for element in order if element.id not in constant_ids]
+
+        memo = _ValueMemo(order)
+        if is_acyclic:
+            # every element goes after the sources of its inputs, so one pass in the order
+            # sees the final values of the inputs and reaches the fixed point
+            num_passes = 0
+            for element in order:
+                values_to_update[element.id] = memo.calc_value(element)
+        for _ in range(num_passes):
+            for element in order:
+                values_to_update[element.id] = memo.calc_value(element, update=False)
+            changed = False
+            for element in order:
+                if values_to_update[element.id] != element.value:
+                    memo.value_changed(element.id)
+                    changed = True
             self._update_values(values_to_update)
+            if not changed:
+                # a fixed point, the remaining passes can't change anything
+                break
 
-        records_of_out_values = []
-        final_out_values = copy.deepcopy(values_to_update)
+        # hashable signatures of the values after each pass
+        seen_signatures = set()
+        # the values are flat dictionaries of signals, copying them one level deep is enough
+        final_out_values = {element_id: dict(out_values) for element_id, out_values in values_to_update.items()}
 
+        # the values of the current pass, every pass overwrites the same keys in the same order
+        cur_out_values = {}
         while True:
-            cur_out_values = {}
-            for element_id in self._elements:
-                cur_out_values[element_id] = self._elements[element_id].calc_value()
-                for out_name in cur_out_values[element_id]:
-                    if cur_out_values[element_id][out_name] != final_out_values[element_id][out_name]:
-                        final_out_values[element_id][out_name] = None
-            if cur_out_values in records_of_out_values:
+            changed = False
+            for element in order:
+                element_id = element.id
+                previous_value = element.value
+                value = cur_out_values[element_id] = memo.calc_value(element)
+                if value == previous_value:
+                    # the previous value was already compared with the final one
+                    continue
+                memo.value_changed(element_id)
+                changed = True
+                final_value = final_out_values[element_id]
+                for out_name, out_value in value.items():
+                    if out_value != final_value[out_name]:
+                        final_value[out_name] = None
+            if not changed:
+                # the values are the same as before the pass, so the period is a single pass
+                break
+            # the elements and their outputs are always visited in the same order,
+            # so the signatures of equal values are equal
+            signature = tuple(tuple(out_values.values()) for out_values in cur_out_values.values())
+            if signature in seen_signatures:
                 # current values was previously encountered, so we went through the whole period
                 break
-            records_of_out_values.append(cur_out_values)
+            seen_signatures.add(signature)
 
         return final_out_values
 
+    def run_vector(self, variable_values: Dict[str, Sequence[bool]],
+                   max_workers: Optional[int] = None) -> Dict[str, Dict[str, np.ndarray]]:
+        '''
+        Evaluates a combinational scheme in many trials at once. <variable_values> maps ids of
+        variable elements to the sequences of their values in each trial, other variables keep
+        their current value. Raises ValueError if some id is not an id of a variable.
+        Return: dictionary that maps ids of elements to dictionaries of outputs, each output
+                is a boolean array with the value in each trial
+
+        Trials are packed into np.uint64 words and evaluated by run_batch
+        '''
+        num_trials = {len(values) for values in variable_values.values()}
+        if len(num_trials) > 1:
+            raise ValueError('Variables must have the same number of trials')
+        num_trials = num_trials.pop() if num_trials else 1
+
+        variable_words = {id_: _pack_lanes(values) for id_, values in variable_values.items()}
+        vector_values = self.run_batch(variable_words, -(-num_trials // 64), max_workers)
+
+        return {id_: {label: _unpack_lanes(words, num_trials) for label, words in outs.items()}
+                for id_, outs in vector_values.items()}
+
+    def run_batch(self, variable_words: Dict[str, np.ndarray], num_words: int,
+                  max_workers: Optional[int] = None) -> Dict[str, Dict[str, np.ndarray]]:
+        '''
+        Evaluates a combinational scheme in 64 * <num_words> trials at once. <variable_words>
+        maps ids of variable elements to <num_words> np.uint64 words, bit i of word j is
+        the value of the variable in trial 64 * j + i (see _pack_lanes); other variables keep
+        their current value. Raises ValueError if some id is not an id of a variable.
+        Return: dictionary that maps ids of elements to dictionaries of the words of outputs
+
+        Every bitwise operation evaluates 64 trials (see BasicElement.calc_vector), so every
+        input of every element must be connected.
+        Schemes of gates and multiplexers are evaluated by CompiledScheme in one loop.
+        Other schemes are evaluated element by element, and if <max_workers> is given,
+        the elements of each level (see _evaluation_levels) are evaluated by a pool of
+        <max_workers> threads. This pays off only for many trials, since numpy releases
+        the GIL on large arrays of words
+        '''
+        for id_ in variable_words:
+            if self[id_].element_type != 'VARIABLE':
+                raise ValueError(f"Element <{id_}> is not a variable")
+        variable_words = {id_: np.broadcast_to(np.asarray(words, dtype=np.uint64), (num_words,))
+                          for id_, words in variable_words.items()}
+
+        try:
+            compiled = self.freeze()
+        except NotImplementedError:
+            # some elements can't be lowered, evaluate element by element
+            order = self._ordered_elements()
+            levels = _evaluation_levels(order)
+
+            def calc_vector(element):
+                if element.id in variable_words:
+                    element.vector_value = {'out': variable_words[element.id]}
+                else:
+                    element.calc_vector()
+
+            if max_workers is None:
+                for element in order:
+                    calc_vector(element)
+            else:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    for level in levels:
+                        # list() waits for the whole level and reraises exceptions
+                        list(executor.map(calc_vector, level))
+            # the values of the elements fed only by constants are single words, all the
+            # outputs get <num_words> words like the outputs of the compiled scheme
+            return {element.id: {label: np.array(np.broadcast_to(words, (num_words,)), dtype=np.uint64)
+                                 for label, words in element.vector_value.items()}
+                    for element in order}
+        return compiled.evaluate(variable_words, num_words)
+
+    def freeze(self) -> CompiledScheme:
+        '''
+        Returns the scheme lowered to flat arrays (see CompiledScheme). The result is cached
+        until the elements or connections of the scheme change; variables are read on every
+        evaluation, so switching them doesn't require a new freeze.
+        Raises CyclicSchemeError for schemes with cycles and NotImplementedError
+        for schemes with elements that can't be lowered
+        '''
+        if self._compiled_tick != self._tick:
+            order = self._ordered_elements()
+            try:
+                if not _is_acyclic(order):
+                    raise CyclicSchemeError()
+                compiled = CompiledScheme(order)
+            except (CyclicSchemeError, NotImplementedError, ValueError) as error:
+                # the reasons the scheme can't be lowered are cached as well, since Scheme.run
+                # tries to freeze the scheme on every call; unexpected errors are not cached
+                self._compiled = None
+                self._compile_error = error
+                self._compiled_tick = self._tick
+                raise
+            self._compiled = compiled
+            self._compile_error = None
+            self._compiled_tick = self._tick
+        if self._compiled is None:
+            raise self._compile_error.with_traceback(None)
+        return self._compiled
+
     def __iter__(self):
         return iter(self._elements.values())
 
-    def _reset(self):
-        for element in self._elements.values():
-            element.reset_value()
-
     def move(self, element_id, new_position):
         '''
         Moves element with element_id to new_position
@@ -229,7 +647,14 @@ class Scheme:
         '''
         Deletes all elements from scheme and their connections
         '''
-        iter_elements = self._elements.copy()
-        for elem_id in iter_elements.keys():
-            self.delete_element(elem_id)
+        # every connection goes between elements of the scheme, so each element drops its own ends
+        # of the connections instead of detaching them from the peers one by one
+        for element in self._elements.values():
+            for in_label, in_connection in element.ins.items():
+                if in_connection is not None:
+                    element.delete_input_connection(in_label)
+            for out_label in element.outs:
+                element.delete_output_connection(out_label)
+        self._elements.clear()
+        self._scheme_changed()
 
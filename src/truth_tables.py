@@ -32,7 +32,7 @@ class TruthTable:
         """
         self._num_args = len(arg_names)
 
-        data = np.full(shape=(2**self._num_args, len(out_names)), dtype=np.int8, fill_value=False)
+        data = np.full(shape=(1 << self._num_args, len(out_names)), dtype=np.int8, fill_value=False)
 
         self._data = pd.DataFrame(columns=out_names, dtype=bool) # stores data
 
@@ -59,7 +59,9 @@ class TruthTable:
         return binary_repr
 
     def get_value(self, args):
-        idx = sum(2**(self._num_args-i-1) for i in range(self._num_args) if args[i])
+        idx = 0
+        for arg in args:
+            idx = (idx << 1) | bool(arg)
         return self._data[idx]
 
     def predict_value(self, incomplete_args: Dict[str, bool]):
@@ -67,25 +69,25 @@ class TruthTable:
         1. True or False if unspecified arguments are nonessential.
         2. None if missed arguments are essential.
         """
-        incomplete_args = {key: val for key, val in incomplete_args.items() if val is not None}
-
-        num_missed_args = self._num_args - len(incomplete_args)
-        missed = []
-        for name in self._names_to_nums:
-            if name not in incomplete_args:
-                missed.append(2**self._names_to_nums[name])
-
-        return_if_cant_predict = {name: None for name in self._data.columns}
-
-        first_index = sum(2**self._names_to_nums[i] for i in incomplete_args if incomplete_args[i])
-        value = None
-        for is_included in itertools.product([False, True], repeat=num_missed_args):
-            cur_index = first_index + sum(missed[j] for j in range(num_missed_args) if is_included[j])
-            cur_value = self._data.loc[cur_index]
-            if value is None:
-                value = cur_value
-            elif np.any(value != cur_value):
-                return return_if_cant_predict
+        # pack the known arguments into bitmasks: each argument is one bit of the row index
+        known_mask = 0
+        first_index = 0
+        for name, val in incomplete_args.items():
+            if val is None:
+                continue
+            bit = 1 << self._names_to_nums[name]
+            known_mask |= bit
+            if val:
+                first_index |= bit
+        missed_mask = ((1 << self._num_args) - 1) & ~known_mask
+
+        value = self._data.loc[first_index]
+        # enumerate every nonzero subset of the missed bits
+        subset = missed_mask
+        while subset:
+            if np.any(value != self._data.loc[first_index | subset]):
+                return {name: None for name in self._data.columns}
+            subset = (subset - 1) & missed_mask
         return dict(value)
 
     def __str__(self):
@@ -101,9 +103,9 @@ class TruthTable:
         def mux_func(lst_args):
             idx = 0
             for i in range(num_select_lines):
-                idx += 2**i * lst_args[i]
+                idx += (1 << i) * lst_args[i]
             return [bool(lst_args[num_select_lines+idx])]
-        args_names = [f"sel{i+1}" for i in range(num_select_lines)] + [f"in{i+1}" for i in range(2**num_select_lines)]
+        args_names = [f"sel{i+1}" for i in range(num_select_lines)] + [f"in{i+1}" for i in range(1 << num_select_lines)]
         outs_names = ['out']
         return cls(args_names, outs_names, mux_func)
 
@@ -111,13 +113,13 @@ class TruthTable:
     def get_encoder_truth_table(cls, num_output_lines):
         def encoder_func(lst_args):
             out = [False] * num_output_lines
-            for input_line in range(2**num_output_lines):
+            for input_line in range(1 << num_output_lines):
                 if lst_args[input_line] == True:
                     binary = cls._int_to_binary(input_line, num_output_lines)
                     for idx, val in enumerate(binary[::-1]):
                         out[idx] = out[idx] or val
             return out
-        args_names = [f"input_line_{i+1}" for i in range(2**num_output_lines)]
+        args_names = [f"input_line_{i+1}" for i in range(1 << num_output_lines)]
         outs_names = [f"output_line_{i+1}" for i in range(num_output_lines)]
         return cls(args_names, outs_names, encoder_func)
 
@@ -126,12 +128,12 @@ class TruthTable:
         def decoder_func(lst_args):
             decoded = 0
             for input_line in range(num_input_lines):
-                decoded += lst_args[input_line] * 2**input_line
-            out = [False] * 2**num_input_lines
+                decoded += lst_args[input_line] * (1 << input_line)
+            out = [False] * (1 << num_input_lines)
             out[decoded] = True
             return out
         args_names = [f"in{i}" for i in range(num_input_lines)]
-        outs_names = [f"out{i}" for i in range(2**num_input_lines)]
+        outs_names = [f"out{i}" for i in range(1 << num_input_lines)]
         return cls(args_names, outs_names, decoder_func)
 
     @classmethod
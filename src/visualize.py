@@ -7,11 +7,123 @@ from src.custom_elements import Constant, Variable, Not
 from src.scheme import Scheme
 from PIL import Image, ImageTk
 import io
+import numpy as np
 import matplotlib.pyplot as plt
-from typing import Dict, Union, List
+from typing import Dict, Union, List, Tuple
+import functools
 import src.elements as elements
 
 
+# images that are at most that many times larger than the maximal size are not resized
+_RESIZE_TOLERANCE = 1.05
+# downscale ratio starting from which the cheaper NEAREST resampling is used instead of BILINEAR
+_NEAREST_RESIZE_RATIO = 2
+
+# attributes of the elements that the sets of their pins depend on
+_PIN_SIZE_ATTRIBUTES = {'MULTIPLEXER': 'number_select_lines',
+                        'ENCODER': 'number_output_lines',
+                        'DECODER': 'number_input_lines',
+                        'FULLADDER': None,
+                        'ADDERSUBTRACTOR': 'number_bits',
+                        'SHIFTER': 'number_bits',
+                        'SR_FLIPFLOP': None,
+                        'D_FLIPFLOP': None}
+
+
+@functools.lru_cache(maxsize=256)
+def _build_pins(element_type: str, size: int) -> Tuple[sd_elem.IcPin, ...]:
+    """Build the pins of an integrated circuit of <element_type>, <size> is the value of
+    its attribute in _PIN_SIZE_ATTRIBUTES (0 if there is none). The pins are only read
+    by schemdraw, so the same pins are shared by all the elements of the same shape"""
+    if element_type == "MULTIPLEXER":
+        pins = []
+        for i in range(1, size + 1):
+            pins.append(
+                sd_elem.IcPin(name=f'sel{i}', anchorname=f'sel{i}',
+                              side='B'))
+        for i in range(1, (1 << size) + 1):
+            pins.append(
+                sd_elem.IcPin(name=f'in{i}', anchorname=f'in{i}',
+                              side='L'))
+        pins.append(sd_elem.IcPin(name='out', side='R'))
+
+    elif element_type == "ENCODER":
+        pins = []
+        for i in range(1, size + 1):
+            pins.append(
+                sd_elem.IcPin(name=f'output_line_{i}', anchorname=f'output_line_{i}',
+                              side='right'))
+        for i in range(1, (1 << size) + 1):
+            pins.append(
+                sd_elem.IcPin(name=f'input_line_{i}', anchorname=f'input_line_{i}',
+                              side='left'))
+
+    elif element_type == "DECODER":
+        pins = []
+        for i in range(size):
+            pins.append(
+                sd_elem.IcPin(name=f'in{i}', anchorname=f'in{i}',
+                              side='left'))
+        for i in range(1 << size):
+            pins.append(
+                sd_elem.IcPin(name=f'out{i}', anchorname=f'out{i}',
+                              side='right'))
+
+    elif element_type == "FULLADDER":
+        pins = [sd_elem.IcPin(name='A', side='left'),
+                sd_elem.IcPin(name='B', side='left'),
+                sd_elem.IcPin(name='Cin', side='left'),
+                sd_elem.IcPin(name='S', side='right'),
+                sd_elem.IcPin(name='Cout', side='right')]
+
+    elif element_type == "ADDERSUBTRACTOR":
+        pins = []
+        for i in range(size):
+            pins.append(sd_elem.IcPin(name=f'A{i}', side='left'))
+        for i in range(size):
+            pins.append(sd_elem.IcPin(name=f'B{i}', side='left'))
+        pins.append(sd_elem.IcPin(name=f'sub', side='left'))
+        for i in range(size):
+            pins.append(sd_elem.IcPin(name=f'S{i}', side='right'))
+        pins.append(sd_elem.IcPin(name=f'Cout', side='right'))
+
+    elif element_type == "SHIFTER":
+        pins = []
+        for i in range(size):
+            pins.append(sd_elem.IcPin(name=f'in{i}', side='left'))
+        for i in range(size):
+            pins.append(
+                sd_elem.IcPin(name=f'shift_line{i}', anchorname=f'shift_line{i}',
+                              side='left'))
+        for i in range(size):
+            pins.append(sd_elem.IcPin(name=f'out{i}', side='right'))
+
+    elif element_type == "SR_FLIPFLOP":
+        pins = [sd_elem.IcPin(name='R', side='left'),
+                sd_elem.IcPin(name='E', side='left'),
+                sd_elem.IcPin(name='S', side='left'),
+                sd_elem.IcPin(name='Q', side='right')]
+
+    elif element_type == "D_FLIPFLOP":
+        pins = [sd_elem.IcPin(name='E', side='left'),
+                sd_elem.IcPin(name='D', side='left'),
+                sd_elem.IcPin(name='Q', side='right')]
+
+    return tuple(pins)
+
+
+def _render_tight(fig) -> Image.Image:
+    """Render <fig> framed like Drawing.get_imagedata('png') frames it (savefig with
+    bbox_inches='tight' and the default padding), but to raw RGBA pixels instead of
+    a png that has to be decoded back"""
+    raw = io.BytesIO()
+    fig.savefig(raw, format='rgba', bbox_inches='tight')
+    # the canvas keeps the pixels savefig has drawn, so its buffer has the size of the image
+    height, width = np.asarray(fig.canvas.buffer_rgba()).shape[:2]
+    pixels = np.frombuffer(raw.getvalue(), dtype=np.uint8).reshape(height, width, 4)
+    return Image.fromarray(pixels, 'RGBA')
+
+
 class Visualizer:
     """Visualize scheme elements with schemdraw library"""
 
@@ -104,84 +216,10 @@ class Visualizer:
             kwargs['constant_value'] = scheme_element.value['out']
             kwargs['lbl_size'] = self._default_label_size
 
-        if scheme_element.element_type == "MULTIPLEXER":
-            kwargs['pins'] = []
-            num_select_lines = scheme_element.number_select_lines
-            for i in range(1, num_select_lines + 1):
-                kwargs['pins'].append(
-                    sd_elem.IcPin(name=f'sel{i}', anchorname=f'sel{i}',
-                                  side='B'))
-            for i in range(1, 2 ** num_select_lines + 1):
-                kwargs['pins'].append(
-                    sd_elem.IcPin(name=f'in{i}', anchorname=f'in{i}',
-                                  side='L'))
-            kwargs['pins'].append(sd_elem.IcPin(name='out', side='R'))
-
-        elif scheme_element.element_type == "ENCODER":
-            kwargs['pins'] = []
-            num_output_lines = scheme_element.number_output_lines
-            for i in range(1, num_output_lines + 1):
-                kwargs['pins'].append(
-                    sd_elem.IcPin(name=f'output_line_{i}', anchorname=f'output_line_{i}',
-                                  side='right'))
-            for i in range(1, 2 ** num_output_lines + 1):
-                kwargs['pins'].append(
-                    sd_elem.IcPin(name=f'input_line_{i}', anchorname=f'input_line_{i}',
-                                  side='left'))
-
-        elif scheme_element.element_type == "DECODER":
-            kwargs['pins'] = []
-            num_input_lines = scheme_element.number_input_lines
-            for i in range(num_input_lines):
-                kwargs['pins'].append(
-                    sd_elem.IcPin(name=f'in{i}', anchorname=f'in{i}',
-                                  side='left'))
-            for i in range(2 ** num_input_lines):
-                kwargs['pins'].append(
-                    sd_elem.IcPin(name=f'out{i}', anchorname=f'out{i}',
-                                  side='right'))
-
-        elif scheme_element.element_type == "FULLADDER":
-            kwargs['pins'] = [sd_elem.IcPin(name='A', side='left'),
-                              sd_elem.IcPin(name='B', side='left'),
-                              sd_elem.IcPin(name='Cin', side='left'),
-                              sd_elem.IcPin(name='S', side='right'),
-                              sd_elem.IcPin(name='Cout', side='right')]
-
-        elif scheme_element.element_type == "ADDERSUBTRACTOR":
-            kwargs['pins'] = []
-            num_bits = scheme_element.number_bits
-            for i in range(num_bits):
-                kwargs['pins'].append(sd_elem.IcPin(name=f'A{i}', side='left'))
-            for i in range(num_bits):
-                kwargs['pins'].append(sd_elem.IcPin(name=f'B{i}', side='left'))
-            kwargs['pins'].append(sd_elem.IcPin(name=f'sub', side='left'))
-            for i in range(num_bits):
-                kwargs['pins'].append(sd_elem.IcPin(name=f'S{i}', side='right'))
-            kwargs['pins'].append(sd_elem.IcPin(name=f'Cout', side='right'))
-
-        elif scheme_element.element_type == "SHIFTER":
-            kwargs['pins'] = []
-            num_bits = scheme_element.number_bits
-            for i in range(num_bits):
-                kwargs['pins'].append(sd_elem.IcPin(name=f'in{i}', side='left'))
-            for i in range(num_bits):
-                kwargs['pins'].append(
-                    sd_elem.IcPin(name=f'shift_line{i}', anchorname=f'shift_line{i}',
-                                  side='left'))
-            for i in range(num_bits):
-                kwargs['pins'].append(sd_elem.IcPin(name=f'out{i}', side='right'))
-
-        elif scheme_element.element_type == "SR_FLIPFLOP":
-            kwargs['pins'] = [sd_elem.IcPin(name='R', side='left'),
-                              sd_elem.IcPin(name='E', side='left'),
-                              sd_elem.IcPin(name='S', side='left'),
-                              sd_elem.IcPin(name='Q', side='right')]
-
-        elif scheme_element.element_type == "D_FLIPFLOP":
-            kwargs['pins'] = [sd_elem.IcPin(name='E', side='left'),
-                              sd_elem.IcPin(name='D', side='left'),
-                              sd_elem.IcPin(name='Q', side='right')]
+        if scheme_element.element_type in _PIN_SIZE_ATTRIBUTES:
+            size_attribute = _PIN_SIZE_ATTRIBUTES[scheme_element.element_type]
+            size = getattr(scheme_element, size_attribute) if size_attribute is not None else 0
+            kwargs['pins'] = list(_build_pins(scheme_element.element_type, size))
 
         return kwargs
 
@@ -189,15 +227,18 @@ class Visualizer:
                                visual_elements: Dict[str, sd_elem.Element],
                                drawing: schemdraw.Drawing):
         """Create visual input connections for elements"""
+        # an output is read once for every input connected to it,
+        # so the anchors of every element are looked up once
+        absanchors = {id_: visual_element.absanchors
+                      for id_, visual_element in visual_elements.items()}
         for element in self._scheme:
-            for in_label, in_connection in filter(lambda x: x[1] is not None,
-                                                  element.ins.items()):
-                source = visual_elements[in_connection.source.id]
-                destination = visual_elements[in_connection.destination.id]
-
+            destination_anchors = absanchors[element.id]
+            for in_label, in_connection in element.ins.items():
+                if in_connection is None:
+                    continue
                 line = sd_elem.Line().endpoints(
-                    source.absanchors[in_connection.output_label],
-                    destination.absanchors[in_connection.input_label])
+                    absanchors[in_connection.source.id][in_connection.output_label],
+                    destination_anchors[in_label])
                 drawing.add(line)
 
     def _create_drawing(self, iterate_circuit: bool):
@@ -224,7 +265,7 @@ class Visualizer:
         # with custom axis and frame
         drawing.draw(showframe=True, show=False, ax=ax)
 
-        return drawing
+        return drawing, fig
 
     def get_tkinter_image(self, iterate_circuit: bool = False) -> ImageTk.PhotoImage:
         """Return tkinter image for current scheme state
@@ -234,9 +275,10 @@ class Visualizer:
             iterate_circuit: specifies if to calculate output for image
             and iterate circuit
         """
-        drawing = self._create_drawing(iterate_circuit)
+        _, fig = self._create_drawing(iterate_circuit)
 
-        image_bytes = drawing.get_imagedata('png')
+        # take the rendered pixels from the canvas instead of encoding and decoding a png
+        image = _render_tight(fig)
 
         # test drawing
         # plt.show()
@@ -244,7 +286,6 @@ class Visualizer:
         # fix bug that schemdraw doesn't close matplotlib figures
         plt.close('all')
 
-        image = Image.open(io.BytesIO(image_bytes))
         image = self._resize_img(image)
         image = ImageTk.PhotoImage(image)
 
@@ -252,7 +293,8 @@ class Visualizer:
 
     def _resize_img(self, image: Image) -> Image:
         """Resize image so that it fits in (max_width x max_height)"""
-        if image.height <= self._max_height and image.width <= self._max_width:
+        if image.height <= self._max_height * _RESIZE_TOLERANCE and \
+                image.width <= self._max_width * _RESIZE_TOLERANCE:
             return image
 
         width_ratio = image.size[0] / self._max_width
@@ -265,7 +307,8 @@ class Visualizer:
             fit_height = self._max_height
             fit_width = round(image.size[0] / height_ratio)
 
-        fit_image = image.resize((fit_width, fit_height), Image.NEAREST)
+        resample = Image.NEAREST if max(width_ratio, height_ratio) >= _NEAREST_RESIZE_RATIO else Image.BILINEAR
+        fit_image = image.resize((fit_width, fit_height), resample)
 
         return fit_image
 
@@ -0,0 +1,87 @@
+import unittest
+import sys
+
+sys.path.append("..")     # to run tests from tests directory directly
+
+import numpy as np
+
+from src.scheme import Scheme, _evaluation_order, _pack_lanes
+from src.compiled_scheme import CompiledScheme, OP_XOR, OP_NOR
+
+
+class TestCompiledScheme(unittest.TestCase):
+    def setUp(self):
+        self.scheme = Scheme()
+        self.scheme.add_element('variable', 'a', position=(1, 1))
+        self.scheme.add_element('variable', 'b', position=(1, 2))
+        self.scheme.add_element('constant', 'c', position=(1, 3), constant_value=False)
+        self.scheme.add_element('xor', 'x', position=(2, 1), num_inputs=3)
+        self.scheme.add_element('nor', 'n', position=(2, 2))
+        self.scheme.add_element('not', 'not', position=(2, 3))
+        self.scheme.add_element('multiplexer', 'm', position=(3, 1), num_select_lines=2)
+        for label, source in (('in1', 'a'), ('in2', 'b'), ('in3', 'c')):
+            self.scheme.add_connection(source, 'out', 'x', label)
+        self.scheme.add_connection('a', 'out', 'n', 'in1')
+        self.scheme.add_connection('b', 'out', 'n', 'in2')
+        self.scheme.add_connection('n', 'out', 'not', 'in')
+        for label, source in (('sel1', 'a'), ('sel2', 'b'), ('in1', 'x'), ('in2', 'n'),
+                              ('in3', 'not'), ('in4', 'c')):
+            self.scheme.add_connection(source, 'out', 'm', label)
+
+    def test_evaluate(self):
+        order = _evaluation_order(self.scheme)
+        variable_words = {'a': _pack_lanes([False, True] * 40), 'b': _pack_lanes([False, False, True, True] * 20)}
+
+        compiled = CompiledScheme(order).evaluate(variable_words, 2)
+
+        for element in order:
+            if element.id in variable_words:
+                element.vector_value = {'out': variable_words[element.id]}
+            else:
+                element.calc_vector()
+        for element in order:
+            self.assertTrue(np.array_equal(np.broadcast_to(element.vector_value['out'], (2,)),
+                                           compiled[element.id]['out']))
+
+    def test_fused_function(self):
+        compiled = CompiledScheme(_evaluation_order(self.scheme))
+        source_words = compiled._source_words({'a': _pack_lanes([True, False] * 40)}, 2)
+
+        kernel_wires = compiled._evaluate_kernel(source_words, 2)
+        fused_wires = compiled._evaluate_fused(source_words, 2)
+        self.assertEqual(len(kernel_wires), len(fused_wires))
+        for kernel_words, fused_words in zip(kernel_wires, fused_wires):
+            self.assertTrue(np.array_equal(kernel_words, fused_words))
+
+        # the generated function works for scalar booleans as well
+        self.assertEqual(len(compiled.fused_function([True, False, False], True)), len(kernel_wires))
+
+    def test_layered(self):
+        compiled = CompiledScheme(_evaluation_order(self.scheme))
+        source_words = compiled._source_words({'a': _pack_lanes([True, False] * 40)}, 2)
+
+        # x and n go to the first layer, not to the second one and the multiplexer to the next ones
+        self.assertEqual([op_code for op_code, _, _ in compiled.groups][:2], [OP_XOR, OP_NOR])
+        kernel_wires = compiled._evaluate_kernel(source_words, 2)
+        layered_wires = compiled._evaluate_layered(source_words, 2)
+        self.assertTrue(np.array_equal(kernel_wires, layered_wires))
+
+    def test_evaluate_signals(self):
+        order = _evaluation_order(self.scheme)
+        compiled = CompiledScheme(order)
+        self.scheme['b'].switch(False)
+
+        signals = compiled.evaluate_signals()
+        for element in order:
+            self.assertEqual(signals[element.id], element.calc_value())
+
+        self.scheme.add_element('constant', 'u', position=(4, 1), constant_value=None)
+        self.assertIsNone(CompiledScheme(_evaluation_order(self.scheme)).evaluate_signals())
+
+    def test_not_compilable(self):
+        self.scheme.add_element('fulladder', 'f', position=(4, 1))
+        self.assertRaises(NotImplementedError, CompiledScheme, _evaluation_order(self.scheme))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,9 @@
 import unittest
 import sys
+import gc
+import weakref
+
+import numpy as np
 
 sys.path.append("..")     # to run tests from tests directory directly
 
@@ -116,6 +120,16 @@ class TestElements(unittest.TestCase):
 
         self.assertEqual(self.nor_gate.calc_value(), {'out': False})
 
+    def test_gates_with_unknown_inputs(self):
+        for type_, known_value, expected in ((AndGate, False, False), (AndGate, True, None),
+                                             (OrGate, True, True), (OrGate, False, None),
+                                             (NandGate, False, True), (NorGate, True, False),
+                                             (XorGate, True, None)):
+            element = type_(id_="1", num_inputs=3)
+            constant = Constant("c0", constant_value=known_value)
+            self._connect_two_elements(constant, 'out', element, 'in2')
+            self.assertEqual(element.calc_value(), {'out': expected})
+
     def test_not(self):
         not_gate = NotGate("not_gate0")
         self.assertEqual(not_gate.calc_value(), {'out': None})
@@ -166,6 +180,21 @@ class TestElements(unittest.TestCase):
         self.assertEqual(multiplexer.calc_value()['out'], False)
         self.assertEqual(multiplexer.element_type, "MULTIPLEXER")
 
+    def test_multiplexer_select_lines(self):
+        multiplexer = Multiplexer('multiplexer2', num_select_lines=2)
+        for label, val in (('in1', True), ('in2', True), ('in3', False), ('in4', True)):
+            self._connect_two_elements(Constant('c', constant_value=val), 'out', multiplexer, label)
+        self.assertEqual(multiplexer.calc_value(), {'out': None})
+
+        self._connect_two_elements(Constant('c', constant_value=False), 'out', multiplexer, 'sel2')
+        self.assertEqual(multiplexer.calc_value(), {'out': True})
+
+        self._connect_two_elements(Constant('c', constant_value=True), 'out', multiplexer, 'sel2')
+        self.assertEqual(multiplexer.calc_value(), {'out': None})
+
+        self._connect_two_elements(Constant('c', constant_value=False), 'out', multiplexer, 'sel1')
+        self.assertEqual(multiplexer.calc_value(), {'out': False})
+
     def test_encoder(self):
         encoder = Encoder('encoder', num_output_lines=1)
 
@@ -381,6 +410,43 @@ class TestElements(unittest.TestCase):
 
         self.assertEqual(right_shifter.calc_value(), {'out0': False, 'out1': True, 'out2': False, 'out3': True})
 
+    def test_shared_values(self):
+        decoder1 = Decoder('d1', num_input_lines=2)
+        decoder2 = Decoder('d2', num_input_lines=2)
+        value = decoder1.calc_value()
+        self.assertIs(decoder2.calc_value(), value)
+        # the value is shared, so it can't be changed
+        with self.assertRaises(TypeError):
+            value['out0'] = True
+
+        # the cache doesn't refer to the element, so it is freed without the cycle collector
+        reference = weakref.ref(decoder1)
+        gc.disable()
+        try:
+            del decoder1
+            self.assertIsNone(reference())
+        finally:
+            gc.enable()
+
+    def test_addersubtractor_vector(self):
+        addersubtractor = AdderSubtractor("Adder-subtractor1", num_bits=2)
+        variables = {}
+        for label in addersubtractor.ins:
+            variables[label] = Variable(label)
+            self._connect_two_elements(variables[label], 'out', addersubtractor, label)
+
+        # trial i has the bits of i on the inputs A0, A1, B0, B1, sub
+        for bit, label in enumerate(['A0', 'A1', 'B0', 'B1', 'sub']):
+            word = sum(1 << trial for trial in range(32) if trial >> bit & 1)
+            variables[label].vector_value = {'out': np.array([word], dtype=np.uint64)}
+        vector_value = addersubtractor.calc_vector()
+
+        for trial in range(32):
+            for bit, label in enumerate(['A0', 'A1', 'B0', 'B1', 'sub']):
+                variables[label].switch(bool(trial >> bit & 1))
+            for out_label, out_value in addersubtractor.calc_value().items():
+                self.assertEqual(bool(int(vector_value[out_label][0]) >> trial & 1), out_value)
+
     @staticmethod
     def _connect_two_elements(element1, output, element2, input_):
         connection = Connection(element1, output, element2, input_)
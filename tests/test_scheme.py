@@ -2,8 +2,11 @@
 Test module for Scheme
 '''
 import unittest
+from unittest import mock
 import sys
 
+import numpy as np
+
 sys.path.append("..")     # to run tests from tests directory directly
 
 from src.scheme import Scheme
@@ -11,6 +14,9 @@ from src.scheme import IdIsAlreadyTakenError
 from src.scheme import NoSuchOutputLabelError
 from src.scheme import NoSuchInputLabelError
 from src.scheme import NoSuchIdError
+from src.scheme import CyclicSchemeError
+from src.scheme import _evaluation_order, _evaluation_levels, _constant_elements, _is_acyclic
+from src.scheme import _connected_components
 
 
 class TestScheme(unittest.TestCase):
@@ -88,6 +94,13 @@ class TestScheme(unittest.TestCase):
         self.scheme.delete_connection(1, 'out', 2, 'in1')
         self.assertEqual(t_elem1.outs['out'], [])
 
+        # other connections of the output are kept
+        self.scheme.add_connection(1, 'out', 2, 'in1')
+        self.scheme.add_connection(1, 'out', 2, 'in2')
+        self.scheme.delete_connection(1, 'out', 2, 'in1')
+        self.assertIsNone(t_elem2.ins['in1'])
+        self.assertEqual(t_elem1.outs['out'], [t_elem2.ins['in2']])
+
 
     def test_run(self):
         self.scheme.add_element('constant', 1, constant_value=True, position=(1, 1))
@@ -101,6 +114,198 @@ class TestScheme(unittest.TestCase):
         self.assertTrue(self.scheme.run()[3]['out'])
         self.assertFalse(self.scheme.run()[4]['out'])
 
+    def test_run_acyclic(self):
+        self.scheme.add_element('variable', 1, position=(1, 1))
+        self.scheme.add_element('constant', 2, constant_value=True, position=(1, 2))
+        self.scheme.add_element('not', 3, position=(2, 1))
+        self.scheme.add_element('not', 4, position=(3, 1))
+        self.scheme.add_element('dflipflop', 5, position=(4, 1))
+        self.scheme.add_connection(1, 'out', 3, 'in')
+        self.scheme.add_connection(3, 'out', 4, 'in')
+        self.scheme.add_connection(4, 'out', 5, 'D')
+        self.scheme.add_connection(2, 'out', 5, 'E')
+
+        for _ in range(2):
+            value = self.scheme[1].value['out']
+            self.assertEqual(self.scheme.run()[5], {'Q': value})
+            self.assertEqual(self.scheme.run()[3], {'out': not value})
+            self.scheme[1].switch()
+
+    def test_run_cache(self):
+        self.scheme.add_element('variable', 1, position=(1, 1))
+        self.scheme.add_element('not', 2, position=(2, 1))
+        self.scheme.add_connection(1, 'out', 2, 'in')
+
+        result = self.scheme.run()
+        run_key = self.scheme._last_run_key
+        result[2]['out'] = None
+        self.assertEqual(self.scheme.run()[2], {'out': False})
+        self.assertEqual(self.scheme._last_run_key, run_key)
+
+        self.scheme[1].switch()
+        self.assertEqual(self.scheme.run()[2], {'out': True})
+        self.scheme.add_element('dflipflop', 3, position=(3, 1))
+        self.assertIsNone(self.scheme._run_key())
+
+    def test_evaluation_order(self):
+        self.scheme.add_element('not', 1, position=(1, 1))
+        self.scheme.add_element('and', 2, position=(1, 2))
+        self.scheme.add_element('constant', 3, position=(1, 3))
+        self.scheme.add_connection(2, 'out', 1, 'in')
+        self.scheme.add_connection(3, 'out', 2, 'in1')
+        self.scheme.add_connection(1, 'out', 2, 'in2')
+
+        order = [element.id for element in _evaluation_order(self.scheme)]
+        self.assertEqual(sorted(order), [1, 2, 3])
+        self.assertLess(order.index(3), order.index(2))
+        self.assertRaises(CyclicSchemeError, _evaluation_levels, _evaluation_order(self.scheme))
+        self.assertFalse(_is_acyclic(_evaluation_order(self.scheme)))
+
+        self.scheme.delete_connection(1, 'out', 2, 'in2')
+        self.assertTrue(_is_acyclic(_evaluation_order(self.scheme)))
+        levels = _evaluation_levels(_evaluation_order(self.scheme))
+        self.assertEqual([[element.id for element in level] for level in levels], [[3], [2], [1]])
+
+        order = self.scheme._ordered_elements()
+        self.assertIs(self.scheme._ordered_elements(), order)
+        self.scheme.add_element('not', 4, position=(1, 4))
+        self.assertEqual(len(self.scheme._ordered_elements()), 4)
+
+    def test_connected_components(self):
+        self.scheme.add_element('variable', 1, position=(1, 1))
+        self.scheme.add_element('not', 2, position=(2, 1))
+        self.scheme.add_element('not', 3, position=(2, 2))
+        self.scheme.add_element('and', 4, position=(3, 1))
+        self.scheme.add_element('nand', 5, position=(3, 2))
+        self.scheme.add_connection(1, 'out', 2, 'in')
+        self.scheme.add_connection(3, 'out', 4, 'in1')
+        self.scheme.add_connection(2, 'out', 4, 'in2')
+        self.scheme.add_connection(5, 'out', 5, 'in1')
+
+        components = _connected_components(_evaluation_order(self.scheme))
+        self.assertEqual(sorted(sorted(element.id for element in component) for component in components),
+                         [[1, 2, 3, 4], [5]])
+        self.assertEqual(self.scheme.run()[4], {'out': False})
+
+    def test_constant_elements(self):
+        self.scheme.add_element('constant', 1, position=(1, 1))
+        self.scheme.add_element('variable', 2, position=(1, 2))
+        self.scheme.add_element('not', 3, position=(2, 1))
+        self.scheme.add_element('and', 4, position=(2, 2))
+        self.scheme.add_element('or', 5, position=(3, 1))
+        self.scheme.add_connection(1, 'out', 3, 'in')
+        self.scheme.add_connection(3, 'out', 4, 'in1')
+        self.scheme.add_connection(2, 'out', 5, 'in1')
+        self.scheme.add_connection(4, 'out', 5, 'in2')
+
+        self.assertEqual(_constant_elements(_evaluation_order(self.scheme)), {1, 3, 4})
+        self.assertEqual(self.scheme.run()[5], {'out': True})
+        self.scheme[2].switch()
+        self.assertEqual(self.scheme.run()[5], {'out': False})
+
+    def test_freeze(self):
+        self.scheme.add_element('variable', 1, position=(1, 1))
+        self.scheme.add_element('not', 2, position=(2, 1))
+        self.scheme.add_connection(1, 'out', 2, 'in')
+
+        # unexpected errors are not cached, the next freeze lowers the scheme again
+        with mock.patch('src.scheme.CompiledScheme', side_effect=TypeError):
+            self.assertRaises(TypeError, self.scheme.freeze)
+        compiled = self.scheme.freeze()
+        self.assertIs(self.scheme.freeze(), compiled)
+
+        self.scheme.add_element('fulladder', 3, position=(3, 1))
+        self.assertRaises(NotImplementedError, self.scheme.freeze)
+        self.assertRaises(NotImplementedError, self.scheme.freeze)
+        self.scheme.delete_element(3)
+        self.assertIsNot(self.scheme.freeze(), compiled)
+
+    def test_run_vector(self):
+        self.scheme.add_element('variable', 1, position=(1, 1))
+        self.scheme.add_element('variable', 2, position=(1, 2))
+        self.scheme.add_element('variable', 3, position=(1, 3))
+        self.scheme.add_element('nand', 4, position=(2, 1))
+        self.scheme.add_element('multiplexer', 5, position=(3, 1), num_select_lines=1)
+        self.scheme.add_connection(1, 'out', 4, 'in1')
+        self.scheme.add_connection(2, 'out', 4, 'in2')
+        self.scheme.add_connection(3, 'out', 5, 'sel1')
+        self.scheme.add_connection(4, 'out', 5, 'in1')
+        self.scheme.add_connection(1, 'out', 5, 'in2')
+
+        num_trials = 100
+        values = {id_: [bool((trial >> shift) & 1) for trial in range(num_trials)]
+                  for id_, shift in ((1, 0), (2, 1), (3, 2))}
+        result = self.scheme.run_vector(values)
+
+        for trial in range(num_trials):
+            for id_ in values:
+                self.scheme[id_].switch(values[id_][trial])
+            expected = self.scheme.run()
+            self.assertEqual(result[4]['out'][trial], expected[4]['out'])
+            self.assertEqual(result[5]['out'][trial], expected[5]['out'])
+
+        compiled = self.scheme.freeze()
+        self.assertIs(self.scheme.freeze(), compiled)
+        self.scheme[1].switch()
+        self.assertIs(self.scheme.freeze(), compiled)
+
+        self.scheme.add_element('fulladder', 6, position=(4, 1))
+        for label, source in (('A', 4), ('B', 5), ('Cin', 3)):
+            self.scheme.add_connection(source, 'out', 6, label)
+        result = self.scheme.run_vector(values, max_workers=2)
+        for trial in range(num_trials):
+            for id_ in values:
+                self.scheme[id_].switch(values[id_][trial])
+            expected = self.scheme.run()
+            self.assertEqual(result[6]['S'][trial], expected[6]['S'])
+            self.assertEqual(result[6]['Cout'][trial], expected[6]['Cout'])
+
+        self.scheme.add_element('dflipflop', 7, position=(5, 1))
+        self.scheme.add_connection(6, 'S', 7, 'D')
+        self.scheme.add_connection(6, 'Cout', 7, 'E')
+        self.assertRaises(NotImplementedError, self.scheme.run_vector, values)
+        self.scheme.delete_element(7)
+        self.scheme.delete_element(6)
+
+        self.scheme.delete_connection(1, 'out', 4, 'in1')
+        self.scheme.add_connection(5, 'out', 4, 'in1')
+        self.assertRaises(CyclicSchemeError, self.scheme.run_vector, values)
+
+    def test_run_batch(self):
+        self.scheme.add_element('variable', 1, position=(1, 1))
+        self.scheme.add_element('variable', 2, position=(1, 2))
+        self.scheme.add_element('xor', 3, position=(2, 1))
+        self.scheme.add_element('fulladder', 4, position=(2, 2))
+        self.scheme.add_connection(1, 'out', 3, 'in1')
+        self.scheme.add_connection(2, 'out', 3, 'in2')
+        for label, source in (('A', 1), ('B', 2), ('Cin', 3)):
+            self.scheme.add_connection(source, 'out', 4, label)
+
+        # all the combinations of the inputs, the first one changes every trial
+        variable_words = {1: np.uint64(0xAAAAAAAAAAAAAAAA), 2: np.uint64(0xCCCCCCCCCCCCCCCC)}
+        result = self.scheme.run_batch(variable_words, 2)
+        self.assertEqual(list(result[3]['out']), [0x6666666666666666] * 2)
+        self.assertEqual(list(result[4]['Cout']), [0xEEEEEEEEEEEEEEEE] * 2)
+
+        # outputs fed only by constants have as many words as the others on the element by element path
+        self.scheme.add_element('constant', 5, position=(1, 3), constant_value=True)
+        self.scheme.add_element('fulladder', 6, position=(2, 3))
+        for label in ('A', 'B', 'Cin'):
+            self.scheme.add_connection(5, 'out', 6, label)
+        result = self.scheme.run_batch(variable_words, 2)
+        for id_, label in ((5, 'out'), (6, 'S'), (6, 'Cout'), (4, 'S'), (1, 'out')):
+            self.assertEqual(result[id_][label].shape, (2,))
+        self.assertEqual(list(result[6]['S']), [0xFFFFFFFFFFFFFFFF] * 2)
+        self.assertEqual(list(result[4]['Cout']), [0xEEEEEEEEEEEEEEEE] * 2)
+        self.scheme.delete_element(6)
+        self.scheme.delete_element(5)
+
+        # only variables can be given words, on the element by element path and the compiled one
+        self.assertRaises(ValueError, self.scheme.run_batch, {3: np.uint64(0)}, 2)
+        self.scheme.delete_element(4)
+        self.assertRaises(ValueError, self.scheme.run_batch, {3: np.uint64(0)}, 2)
+        self.assertRaises(ValueError, self.scheme.run_vector, {3: [True, False]})
+
     def test_move(self):
         self.scheme.add_element('constant', 1, position=(1, 1))
         self.scheme.add_element('not', 2, position=(1, 2))
@@ -0,0 +1,78 @@
+'''
+Test module for Visualizer
+'''
+import unittest
+import sys
+import io
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import schemdraw
+from PIL import Image
+
+sys.path.append("..")     # to run tests from tests directory directly
+
+from schemdraw.segments import Segment, SegmentText, SegmentCircle
+
+from src.scheme import Scheme
+from src.visualize import Visualizer, _render_tight
+from src.custom_elements import Constant, Variable
+
+
+@unittest.skipUnless(schemdraw.__version__ == '0.10', 'the drawing needs schemdraw 0.10 from requirements.txt')
+class TestVisualizer(unittest.TestCase):
+    def setUp(self):
+        self.scheme = Scheme()
+        self.scheme.add_element('variable', 'a', position=(1, 1))
+        self.scheme.add_element('constant', 'b', position=(1, 3))
+        self.scheme.add_element('or', 'or', position=(4, 2))
+        self.scheme.add_element('multiplexer', 'm', position=(7, 2), num_select_lines=1)
+        self.scheme.add_connection('a', 'out', 'or', 'in1')
+        self.scheme.add_connection('b', 'out', 'or', 'in2')
+        self.scheme.add_connection('or', 'out', 'm', 'in1')
+
+    def tearDown(self):
+        plt.close('all')
+
+    def test_render_tight(self):
+        drawing, fig = Visualizer(self.scheme)._create_drawing(iterate_circuit=True)
+
+        # the image get_tkinter_image made from the png of the drawing
+        png_image = Image.open(io.BytesIO(drawing.get_imagedata('png')))
+        image = _render_tight(fig)
+        self.assertEqual(image.size, png_image.size)
+        self.assertEqual(image.mode, png_image.mode)
+        self.assertTrue(np.array_equal(np.asarray(image), np.asarray(png_image)))
+
+
+class TestCustomElements(unittest.TestCase):
+    @staticmethod
+    def _segments(element):
+        return [(type(segment).__name__, vars(segment)) for segment in element.segments]
+
+    def test_segments(self):
+        clen, cheight = 0.5, 0.9
+        # the segments the elements were built of before the paths became class constants
+        constant_segments = [Segment([(-clen / 2, -cheight / 2), (-clen / 2, cheight / 2),
+                                      (clen / 2, cheight / 2), (clen / 2, -cheight / 2),
+                                      (-clen / 2, -cheight / 2)]),
+                             Segment([(clen / 2, 0), (clen / 2 + 0.2, 0)]),
+                             SegmentText((0, 0), '0', fontsize=8)]
+        switch_segments = [SegmentCircle((-clen / 6, cheight / 3), 0.01, fill=None),
+                           SegmentCircle((clen / 6, cheight / 3), 0.01, fill=None),
+                           Segment([(-clen / 6, cheight / 3), (clen / 6, cheight / 3 + cheight / 12)])]
+
+        drawing = schemdraw.Drawing()
+        constant = drawing.add(Constant(constant_value=False, lbl_size=8).at((1, 1)))
+        variable = drawing.add(Variable(constant_value=False, lbl_size=8).at((1, 3)))
+        self.assertEqual(self._segments(constant), [(type(segment).__name__, vars(segment))
+                                                    for segment in constant_segments])
+        self.assertEqual(self._segments(variable), [(type(segment).__name__, vars(segment))
+                                                    for segment in constant_segments + switch_segments])
+        self.assertEqual(tuple(variable.absanchors['out']), (1 + clen / 2 + 0.2, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()